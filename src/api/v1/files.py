@@ -1,36 +1,59 @@
-import time
+from typing import Union
 
-from fastapi import APIRouter, Depends, File, UploadFile, status
-from fastapi_pagination import Page, paginate
-from fastapi_pagination.ext.sqlalchemy import AbstractPage
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+    status
+)
+from fastapi_pagination import Page
+from fastapi_pagination.bases import AbstractPage
+from fastapi_pagination.cursor import CursorPage
 from fastapi.responses import FileResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from core.config import re_cli
-from db.db import get_session
+from core.config import app_settings
+from db.db import get_session, pool_stats
 from models.users import UsersTable as User
-from schemas.files import FileInDB, UploadResponse
+from schemas.files import (
+    BatchUploadItem,
+    FileInDB,
+    FolderTree,
+    UploadResponse
+)
+from services.auth_cache import auth_cache
+from services.conditional import check_listing
 from services.files import files_crud
+from services.folders import folders_crud
+from services.health import health_check
+from services.quotas import quotas
 from services.users import get_current_user
+from services.utils import content_length, normalize_path
 
 router = APIRouter()
 
 
 @router.get('/ping', description='Checks the availability of services.')
 async def get_ping(
-        db: AsyncSession = Depends(get_session),
+        response: Response,
         user: User = Depends(get_current_user),
 ) -> dict:
-    start_time = time.time()
-    await files_crud.get(db=db, user=user)
-    ping_db = time.time() - start_time
-    start_time = time.time()
-    re_cli.get('nothing')
-    ping_redis = time.time() - start_time
+    probes = await health_check.check()
+    if any(probe['status'] != 'ok' for probe in probes.values()):
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
     return {
-        'datebase': "{:.4f}".format(ping_db),
-        'redis': "{:.4f}".format(ping_redis),
+        'datebase': "{:.4f}".format(probes['database']['latency']),
+        'redis': "{:.4f}".format(probes['redis']['latency']),
+        'storage': "{:.4f}".format(probes['storage']['latency']),
+        'probes': probes,
         'user': {'name': user.name, 'id': user.id},
+        'auth_cache': auth_cache.stats(),
+        'db_pool': pool_stats(),
     }
 
 
@@ -40,11 +63,61 @@ async def get_ping(
     description='Get user file list.'
 )
 async def get_files_list(
+        request: Request,
+        response: Response,
+        db: AsyncSession = Depends(get_session),
+        user: User = Depends(get_current_user),
+) -> Union[AbstractPage, Response]:
+    not_modified = await check_listing(request, response, user.id)
+    if not_modified is not None:
+        return not_modified
+    return await files_crud.get_page(db=db, user=user)
+
+
+@router.get(
+    '/list/cursor',
+    response_model=CursorPage[FileInDB],
+    description='Get user file list with keyset pagination.'
+)
+async def get_files_cursor(
+        request: Request,
+        response: Response,
+        db: AsyncSession = Depends(get_session),
+        user: User = Depends(get_current_user),
+) -> Union[AbstractPage, Response]:
+    not_modified = await check_listing(request, response, user.id)
+    if not_modified is not None:
+        return not_modified
+    return await files_crud.get_page(db=db, user=user)
+
+
+@router.get(
+    '/tree',
+    response_model=FolderTree,
+    description='Get user folder tree with file counts and sizes.'
+)
+async def get_folder_tree(
+        request: Request,
+        response: Response,
+        path: str = '',
+        depth: int = Query(default=1, ge=1, le=app_settings.tree_max_depth),
         db: AsyncSession = Depends(get_session),
         user: User = Depends(get_current_user),
-) -> AbstractPage:
-    files = await files_crud.get(db=db, user=user)
-    return paginate(files)
+) -> Union[FolderTree, Response]:
+    not_modified = await check_listing(request, response, user.id)
+    if not_modified is not None:
+        return not_modified
+    path = normalize_path(path)
+    tree = await folders_crud.tree(db=db, user=user, path=path, depth=depth)
+    if tree is None:
+        raise HTTPException(
+            status_code=404, detail="Item not found"
+        )
+    tree.files = [
+        FileInDB.from_orm(file) for file in await files_crud.list_folder(
+            db=db, user=user, path=path, limit=app_settings.tree_max_files)
+    ]
+    return tree
 
 
 @router.post(
@@ -55,16 +128,42 @@ async def get_files_list(
     response_model_exclude_unset=True
 )
 async def upload_file(
+    request: Request,
     path: str,
     db: AsyncSession = Depends(get_session),
     user: User = Depends(get_current_user),
     file: UploadFile = File(),
 ) -> UploadResponse:
-    file_upload = await files_crud.create(
-        db=db, file=file, user=user, path=path)
+    async with quotas.reserved(
+        db, user.id, content_length(request)
+    ) as reserve:
+        file_upload = await files_crud.create(
+            db=db, file=file, user=user, path=path, reserve=reserve)
     return UploadResponse(**file_upload)
 
 
+@router.post(
+    '/upload/batch',
+    status_code=status.HTTP_201_CREATED,
+    description='Upload many user files in one request.',
+    response_model=list[BatchUploadItem],
+    response_model_exclude_none=True
+)
+async def upload_files(
+    request: Request,
+    path: str,
+    db: AsyncSession = Depends(get_session),
+    user: User = Depends(get_current_user),
+    files: list[UploadFile] = File(),
+) -> list[BatchUploadItem]:
+    async with quotas.reserved(
+        db, user.id, content_length(request)
+    ) as reserve:
+        results = await files_crud.create_many(
+            db=db, user=user, path=path, files=files, reserve=reserve)
+    return [BatchUploadItem(**item) for item in results]
+
+
 @router.get(
     '/download',
     description='Download user file.',
@@ -72,14 +171,32 @@ async def upload_file(
 )
 async def download_file(
         *,
+        request: Request,
         db: AsyncSession = Depends(get_session),
         user: User = Depends(get_current_user),
         identifier: str | int = None,
         download_folder: bool = False,
 ) -> FileResponse:
     if download_folder:
-        file = await files_crud.download_folder(user=user, path=identifier)
+        file = await files_crud.download_folder(
+            db=db, user=user, path=identifier)
     else:
         file = await files_crud.download_file(
-            db=db, user=user, identifier=identifier)
+            db=db, request=request, user=user, identifier=identifier)
     return file
+
+
+@router.delete(
+    '/delete',
+    status_code=status.HTTP_204_NO_CONTENT,
+    description='Delete user file.',
+    response_class=Response
+)
+async def delete_file(
+        *,
+        db: AsyncSession = Depends(get_session),
+        user: User = Depends(get_current_user),
+        identifier: str | int,
+) -> Response:
+    await files_crud.delete(db=db, user=user, identifier=identifier)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,103 @@
+from fastapi import APIRouter, Depends, Path, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.db import get_session
+from models.users import UsersTable as User
+from schemas.files import (
+    FileInDB,
+    UploadPart,
+    UploadSession,
+    UploadSessionCreate
+)
+from services.uploads import upload_sessions
+from services.users import get_current_user
+from services.utils import content_length
+
+router = APIRouter()
+
+
+@router.post(
+    '/uploads',
+    status_code=status.HTTP_201_CREATED,
+    description='Start a multipart upload session.',
+    response_model=UploadSession
+)
+async def create_upload_session(
+    session: UploadSessionCreate,
+    db: AsyncSession = Depends(get_session),
+    user: User = Depends(get_current_user),
+) -> UploadSession:
+    answer = await upload_sessions.create(
+        db=db,
+        user=user,
+        path=session.path,
+        name=session.name,
+        size=session.size
+    )
+    return UploadSession(**answer)
+
+
+@router.get(
+    '/uploads/{session_id}',
+    description='Get received parts of an upload session.',
+    response_model=UploadSession
+)
+async def get_upload_session(
+    session_id: str,
+    user: User = Depends(get_current_user),
+) -> UploadSession:
+    answer = await upload_sessions.get(user=user, session_id=session_id)
+    return UploadSession(**answer)
+
+
+@router.put(
+    '/uploads/{session_id}/parts/{number}',
+    description='Upload one part, the request body is the raw part data.',
+    response_model=UploadPart
+)
+async def upload_part(
+    request: Request,
+    session_id: str,
+    number: int = Path(ge=1, le=10_000),
+    db: AsyncSession = Depends(get_session),
+    user: User = Depends(get_current_user),
+) -> UploadPart:
+    size = await upload_sessions.write_part(
+        db=db,
+        user=user,
+        session_id=session_id,
+        number=number,
+        stream=request.stream(),
+        length=content_length(request),
+    )
+    return UploadPart(number=number, size=size)
+
+
+@router.post(
+    '/uploads/{session_id}/complete',
+    status_code=status.HTTP_201_CREATED,
+    description='Assemble uploaded parts into a file.',
+    response_model=FileInDB
+)
+async def complete_upload_session(
+    session_id: str,
+    db: AsyncSession = Depends(get_session),
+    user: User = Depends(get_current_user),
+) -> FileInDB:
+    file = await upload_sessions.complete(
+        db=db, user=user, session_id=session_id)
+    return FileInDB.from_orm(file)
+
+
+@router.delete(
+    '/uploads/{session_id}',
+    status_code=status.HTTP_204_NO_CONTENT,
+    description='Abort an upload session.',
+    response_class=Response
+)
+async def abort_upload_session(
+    session_id: str,
+    user: User = Depends(get_current_user),
+) -> Response:
+    await upload_sessions.abort(user=user, session_id=session_id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
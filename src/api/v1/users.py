@@ -1,15 +1,34 @@
 # from typing import Any
 import json
+import math
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from core.config import re_cli
+from core.config import app_settings
+from db.cache import get_redis
 from db.db import get_session
 from schemas import users as schema
-from services.users import get_current_user, token_crud, user_crud
-from services.utils import user_str, validate_password
+from services.auth_cache import publish_invalidation
+from services.quotas import quotas
+from services.tokens import (
+    create_signed_token,
+    is_signed_token,
+    revoke_signed_token
+)
+from services.users import (
+    get_current_user,
+    oauth2_scheme,
+    token_crud,
+    user_crud
+)
+from services.utils import (
+    hash_password_async,
+    needs_rehash,
+    user_str,
+    validate_password_async
+)
 
 router = APIRouter()
 
@@ -42,15 +61,27 @@ async def auth(
     if not user:
         raise HTTPException(
             status_code=400, detail="Incorrect name or password")
-    if not validate_password(form_data.password, user.hashed_password):
+    if not await validate_password_async(
+        form_data.password, user.hashed_password
+    ):
         raise HTTPException(
             status_code=400, detail="Incorrect name or password")
+    if needs_rehash(user.hashed_password):
+        await user_crud.update_password(
+            db=db,
+            user=user,
+            hashed_password=await hash_password_async(form_data.password)
+        )
+    if app_settings.token_mode == 'signed':
+        token, expires = create_signed_token(user)
+        return schema.UserToken(access_token=token, expires=expires)
     token = await token_crud.create_token(db=db, id=user.id)
-    re_cli.set(
+    await get_redis().set(
         str(token.token),
         json.dumps(
             {'expires': token.expires.timestamp(), 'user': user_str(user)}
-        )
+        ),
+        exat=math.ceil(token.expires.timestamp())
     )
     return schema.UserToken(access_token=token.token, expires=token.expires)
 
@@ -63,3 +94,34 @@ async def read_users_me(
     current_user=Depends(get_current_user)
 ) -> schema.UserBase:
     return schema.UserBase(id=current_user.id, name=current_user.name)
+
+
+@router.get(
+    '/usage',
+    response_model=schema.QuotaUsage,
+    description='Get used storage and quota of current user.')
+async def read_usage(
+    db: AsyncSession = Depends(get_session),
+    current_user=Depends(get_current_user)
+) -> schema.QuotaUsage:
+    return schema.QuotaUsage(**await quotas.usage(db, current_user.id))
+
+
+@router.post(
+    '/logout',
+    description='Revoke current token.',
+    status_code=status.HTTP_204_NO_CONTENT,
+    response_class=Response
+)
+async def logout(
+    token: str = Depends(oauth2_scheme),
+    current_user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_session)
+) -> Response:
+    if is_signed_token(token):
+        await revoke_signed_token(token)
+    else:
+        await token_crud.revoke_token(db=db, token=token)
+        await get_redis().delete(token)
+    await publish_invalidation(token)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,387 @@
+"""Нагрузочные сценарии файлового сервера.
+
+По умолчанию приложение запускается в том же процессе через ASGI
+на отдельной БД bench_db тестового сервера (--database) и тестовом
+Redis, с --url запросы идут на уже
+запущенный сервер (uvicorn, nginx). Пиковый RSS считается по /proc:
+для сервера по --url нужен его --server-pid.
+
+    python -m benchmarks.run --concurrency 32 --save baseline.json
+    python -m benchmarks.run --baseline baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, Optional
+from uuid import uuid4
+
+import asyncpg
+from httpx import AsyncClient, Response
+from sqlalchemy.engine import make_url
+
+from core.config import app_settings
+
+API_PREFIX = '/api/v1'
+PASSWORD = 'P@ssw0rd'
+BENCH_DATABASE = str(
+    make_url(app_settings.test_database).set(database='bench_db'))
+# Как часто снимать RSS во время сценария, секунды.
+RSS_INTERVAL = 0.05
+
+Scenario = Callable[[AsyncClient, 'Context', int], Awaitable[int]]
+
+
+class Context:
+    """Пользователь и данные, общие для всех сценариев прогона."""
+
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.name = f'bench-{uuid4().hex[:12]}'
+        self.token = ''
+        self.small = os.urandom(args.small_size)
+        self.large = os.urandom(args.large_size)
+
+    @property
+    def headers(self) -> dict:
+        return {'Authorization': f'Bearer {self.token}'}
+
+
+def unique(content: bytes) -> bytes:
+    """Уникальное содержимое, чтобы загрузка не ушла в дедупликацию."""
+    return uuid4().bytes + content[16:]
+
+
+def rss_mb(pid: Optional[int]) -> Optional[float]:
+    """Текущий RSS процесса, None, если /proc недоступен."""
+    try:
+        with open(f'/proc/{pid or "self"}/status') as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def check(response: Response) -> Response:
+    if response.status_code >= 400:
+        raise RuntimeError(
+            f'{response.request.method} {response.request.url}: '
+            f'{response.status_code} {response.text[:200]}'
+        )
+    return response
+
+
+async def upload(
+    client: AsyncClient,
+    context: Context,
+    path: str,
+    name: str,
+    content: bytes
+) -> int:
+    check(await client.post(
+        '/upload',
+        params={'path': path},
+        files={'file': (name, content)},
+        headers=context.headers
+    ))
+    return len(content)
+
+
+async def upload_small(client: AsyncClient, context: Context, i: int) -> int:
+    return await upload(
+        client, context, 'bench/small', f'{i}-{uuid4().hex}',
+        unique(context.small))
+
+
+async def upload_large(client: AsyncClient, context: Context, i: int) -> int:
+    return await upload(
+        client, context, 'bench/large', f'{i}-{uuid4().hex}',
+        unique(context.large))
+
+
+async def download_full(client: AsyncClient, context: Context, i: int) -> int:
+    response = check(await client.get(
+        '/download',
+        params={'identifier': 'bench/fixed/large.bin'},
+        headers=context.headers
+    ))
+    return len(response.content)
+
+
+async def download_range(
+    client: AsyncClient,
+    context: Context,
+    i: int
+) -> int:
+    start = (i * 65536) % max(len(context.large) - 65536, 1)
+    response = check(await client.get(
+        '/download',
+        params={'identifier': 'bench/fixed/large.bin'},
+        headers={
+            **context.headers,
+            'Range': f'bytes={start}-{start + 65535}',
+        }
+    ))
+    return len(response.content)
+
+
+async def download_zip(client: AsyncClient, context: Context, i: int) -> int:
+    response = check(await client.get(
+        '/download',
+        params={'identifier': 'bench/fixed', 'download_folder': True},
+        headers=context.headers
+    ))
+    return len(response.content)
+
+
+async def list_files(client: AsyncClient, context: Context, i: int) -> int:
+    pages = max(context.args.dataset // 50, 1)
+    response = check(await client.get(
+        '/list',
+        params={'page': i % pages + 1, 'size': 50},
+        headers=context.headers
+    ))
+    return len(response.content)
+
+
+async def login(client: AsyncClient, context: Context, i: int) -> int:
+    response = check(await client.post(
+        '/auth', data={'username': context.name, 'password': PASSWORD}))
+    return len(response.content)
+
+
+SCENARIOS: dict[str, Scenario] = {
+    'upload_small': upload_small,
+    'upload_large': upload_large,
+    'download_full': download_full,
+    'download_range': download_range,
+    'download_zip': download_zip,
+    'list': list_files,
+    'login': login,
+}
+
+
+async def prepare(client: AsyncClient, context: Context) -> None:
+    """Регистрирует пользователя и заливает данные для чтения."""
+    check(await client.post(
+        '/register', json={'name': context.name, 'password': PASSWORD}))
+    response = check(await client.post(
+        '/auth', data={'username': context.name, 'password': PASSWORD}))
+    context.token = response.json()['access_token']
+    await upload(client, context, 'bench/fixed', 'large.bin', context.large)
+    await upload(client, context, 'bench/fixed', 'small.bin', context.small)
+    batch = 100
+    for start in range(0, context.args.dataset, batch):
+        check(await client.post(
+            '/upload/batch',
+            params={'path': 'bench/list'},
+            files=[
+                ('files', (f'{number}.bin', context.small))
+                for number in range(
+                    start, min(start + batch, context.args.dataset))
+            ],
+            headers=context.headers
+        ))
+
+
+async def run_scenario(
+    client: AsyncClient,
+    context: Context,
+    scenario: Scenario,
+    requests: int,
+    concurrency: int
+) -> dict:
+    from services.health import percentile
+
+    latencies: list[float] = []
+    transferred = errors = 0
+    counter = iter(range(requests))
+    # С --url без --server-pid память сервера не видна.
+    measure_rss = not context.args.url or context.args.server_pid
+    peak_rss = rss_mb(context.args.server_pid) if measure_rss else None
+
+    async def sample_rss() -> None:
+        nonlocal peak_rss
+        while True:
+            await asyncio.sleep(RSS_INTERVAL)
+            rss = rss_mb(context.args.server_pid)
+            if rss is not None and peak_rss is not None:
+                peak_rss = max(peak_rss, rss)
+
+    async def worker() -> None:
+        nonlocal transferred, errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                transferred += await scenario(client, context, i)
+            except Exception as error:
+                errors += 1
+                if errors == 1:
+                    print(f'  {error}', file=sys.stderr)
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    sampler = asyncio.create_task(sample_rss())
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        sampler.cancel()
+    elapsed = time.perf_counter() - start
+    return {
+        'requests': requests,
+        'errors': errors,
+        'rps': len(latencies) / elapsed,
+        'p50': percentile(latencies, 0.5),
+        'p90': percentile(latencies, 0.9),
+        'p99': percentile(latencies, 0.99),
+        'bytes_per_second': transferred / elapsed,
+        'peak_rss_mb': peak_rss,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Сценарии, где RPS упал или p99 вырос больше порога."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['rps'] < base['rps'] * (1 - threshold):
+            regressions.append(
+                f'{name}: rps {base["rps"]:.1f} -> {result["rps"]:.1f}')
+        if result['p99'] > base['p99'] * (1 + threshold):
+            regressions.append(
+                f'{name}: p99 {base["p99"]:.4f} -> {result["p99"]:.4f}')
+    return regressions
+
+
+def report(results: dict) -> None:
+    print(
+        f'{"scenario":<16}{"rps":>10}{"p50":>10}{"p90":>10}{"p99":>10}'
+        f'{"MB/s":>10}{"errors":>8}{"rss MB":>9}'
+    )
+    for name, result in results.items():
+        rss = result['peak_rss_mb']
+        print(
+            f'{name:<16}{result["rps"]:>10.1f}{result["p50"]:>10.4f}'
+            f'{result["p90"]:>10.4f}{result["p99"]:>10.4f}'
+            f'{result["bytes_per_second"] / 2 ** 20:>10.2f}'
+            f'{result["errors"]:>8}'
+            f'{"-" if rss is None else f"{rss:.1f}":>9}'
+        )
+
+
+async def create_database(dsn: str) -> None:
+    """Создает БД прогона, если ее еще нет."""
+    url = make_url(dsn)
+    connection = await asyncpg.connect(
+        user=url.username,
+        password=url.password,
+        host=url.host,
+        port=url.port,
+        database='postgres'
+    )
+    try:
+        if await connection.fetchval(
+            'SELECT 1 FROM pg_database WHERE datname = $1', url.database
+        ):
+            return
+        await connection.execute(f'CREATE DATABASE "{url.database}"')
+    finally:
+        await connection.close()
+    connection = await asyncpg.connect(
+        user=url.username,
+        password=url.password,
+        host=url.host,
+        port=url.port,
+        database=url.database
+    )
+    try:
+        await connection.execute('CREATE EXTENSION IF NOT EXISTS "uuid-ossp"')
+    finally:
+        await connection.close()
+
+
+async def create_client(
+        args: argparse.Namespace, folder: str) -> AsyncClient:
+    if args.url:
+        return AsyncClient(
+            base_url=args.url.rstrip('/') + API_PREFIX, timeout=60)
+    # Схема и данные прогона пишутся в отдельную БД, а файлы и логи -
+    # во временную папку folder: настройки подменяются до импорта
+    # приложения.
+    await create_database(args.database)
+    app_settings.database_dsn = args.database
+    app_settings.re_host = app_settings.test_re_host
+    app_settings.file_folder = os.path.join(folder, 'user_file')
+    app_settings.blob_folder = os.path.join(folder, 'user_file', '.blobs')
+    app_settings.log_folder = os.path.join(folder, 'logs')
+    from db.db import Base, engine
+    from main import app
+    await app.router.startup()
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    return AsyncClient(app=app, base_url='http://bench' + API_PREFIX)
+
+
+async def main(args: argparse.Namespace) -> int:
+    context = Context(args)
+    with tempfile.TemporaryDirectory(prefix='bench-') as folder:
+        client = await create_client(args, folder)
+        try:
+            await prepare(client, context)
+            results = {}
+            for name in args.scenarios:
+                print(f'{name}...', file=sys.stderr)
+                results[name] = await run_scenario(
+                    client, context, SCENARIOS[name],
+                    args.requests, args.concurrency)
+        finally:
+            await client.aclose()
+            if not args.url:
+                from main import app
+                await app.router.shutdown()
+    report(results)
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        return 1 if regressions else 0
+    return 0
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='адрес запущенного сервера')
+    parser.add_argument(
+        '--server-pid', type=int, help='PID сервера для замера RSS')
+    parser.add_argument(
+        '--database', default=BENCH_DATABASE,
+        help='БД для запуска в процессе, создается при отсутствии')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument(
+        '--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--dataset', type=int, default=2000)
+    parser.add_argument('--small-size', type=int, default=4 * 1024)
+    parser.add_argument('--large-size', type=int, default=8 * 1024 * 1024)
+    parser.add_argument('--save', help='записать результаты в JSON')
+    parser.add_argument('--baseline', help='сравнить с сохраненным JSON')
+    parser.add_argument(
+        '--threshold', type=float, default=0.1,
+        help='допустимое ухудшение относительно baseline')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main(parse_args())))
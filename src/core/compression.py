@@ -0,0 +1,197 @@
+import zlib
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core.config import app_settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BR = 'br'
+ZSTD = 'zstd'
+GZIP = 'gzip'
+# wbits для zlib: 16 + 15 - формат gzip с максимальным окном.
+GZIP_WBITS = 31
+AVAILABLE = {BR: brotli, ZSTD: zstandard, GZIP: zlib}
+# Куски меньше этого сжимаются прямо в event loop, переход в поток
+# обходится дороже.
+INLINE_SIZE = 16 * 1024
+
+
+def accepted_encodings(header: str) -> dict[str, float]:
+    """Разбирает Accept-Encoding в словарь кодек -> q."""
+    accepted = {}
+    for item in header.split(','):
+        name, *params = item.split(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.strip().partition('=')
+            if key.lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+
+def accepts_encoding(header: str, encoding: str) -> bool:
+    accepted = accepted_encodings(header)
+    return accepted.get(encoding, accepted.get('*', 0.0)) > 0
+
+
+def negotiate(header: str) -> Optional[str]:
+    """Кодек с наибольшим q, при равенстве - первый из настроек."""
+    accepted = accepted_encodings(header)
+    best, best_quality = None, 0.0
+    for encoding in app_settings.response_compression:
+        if AVAILABLE.get(encoding) is None:
+            continue
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class StreamCompressor:
+    """Потоковое сжатие тела ответа с общим API для всех кодеков.
+
+    Каждый кусок дописывается с flush, чтобы клиент получал данные
+    по мере генерации, а не в конце ответа.
+    """
+
+    def __init__(self, encoding: str) -> None:
+        level = app_settings.response_compression_level
+        self.encoding = encoding
+        if encoding == BR:
+            self._packer = brotli.Compressor(quality=level)
+        elif encoding == ZSTD:
+            self._packer = zstandard.ZstdCompressor(
+                level=level).compressobj()
+        else:
+            self._packer = zlib.compressobj(
+                level, zlib.DEFLATED, GZIP_WBITS)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == BR:
+            tail = self._packer.finish() if final else self._packer.flush()
+            return self._packer.process(data) + tail
+        if final:
+            return self._packer.compress(data) + self._packer.flush()
+        mode = (
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK if self.encoding == ZSTD
+            else zlib.Z_SYNC_FLUSH
+        )
+        return self._packer.compress(data) + self._packer.flush(mode)
+
+
+def should_compress(status: int, headers: Headers) -> bool:
+    if status < 200 or status >= 300 or status in (204, 206):
+        return False
+    if 'content-encoding' in headers:
+        return False
+    if 'no-transform' in headers.get('cache-control', ''):
+        return False
+    length = headers.get('content-length')
+    if (
+        length is not None
+        and int(length) < app_settings.response_compression_min_size
+    ):
+        return False
+    media_type = headers.get('content-type', '').partition(';')[0]
+    media_type = media_type.strip().lower()
+    return (
+        media_type.partition('/')[0] not in (
+            app_settings.compression_skip_types)
+        and media_type not in app_settings.incompressible_media_types
+    )
+
+
+class CompressedSend:
+    """Обертка над send, сжимающая тело ответа, если это имеет смысл."""
+
+    def __init__(self, send: Send, encoding: str) -> None:
+        self._send = send
+        self._encoding = encoding
+        self._start: Optional[Message] = None
+        self._packer: Optional[StreamCompressor] = None
+        self._passthrough = False
+
+    async def __call__(self, message: Message) -> None:
+        if message['type'] == 'http.response.start':
+            self._start = message
+            self._passthrough = not should_compress(
+                message['status'], Headers(raw=message['headers']))
+            if self._passthrough:
+                await self._send(message)
+            return
+        if message['type'] != 'http.response.body' or self._passthrough:
+            await self._send(message)
+            return
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+        if self._packer is None:
+            if (
+                not more_body
+                and len(body) < app_settings.response_compression_min_size
+            ):
+                self._passthrough = True
+                await self._send(self._start)
+                await self._send(message)
+                return
+            self._packer = StreamCompressor(self._encoding)
+            await self._send(self.compressed_start())
+        if len(body) > INLINE_SIZE:
+            body = await run_in_threadpool(
+                self._packer.compress, body, not more_body)
+        else:
+            body = self._packer.compress(body, not more_body)
+        await self._send({
+            'type': 'http.response.body',
+            'body': body,
+            'more_body': more_body,
+        })
+
+    def compressed_start(self) -> Message:
+        headers = MutableHeaders(raw=list(self._start['headers']))
+        del headers['content-length']
+        headers['content-encoding'] = self._encoding
+        vary = headers.get('vary', '')
+        if 'accept-encoding' not in vary.lower():
+            headers['vary'] = (
+                f'{vary}, Accept-Encoding' if vary else 'Accept-Encoding')
+        # Сжатое представление побайтно отличается от исходного.
+        etag = headers.get('etag')
+        if etag is not None and not etag.startswith('W/'):
+            headers['etag'] = f'W/{etag}'
+        return {**self._start, 'headers': headers.raw}
+
+
+class CompressionMiddleware:
+    """Сжимает ответы кодеком, согласованным по Accept-Encoding."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(
+            Headers(scope=scope).get('accept-encoding', ''))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, CompressedSend(send, encoding))
@@ -1,7 +1,5 @@
 import os
-import sys
 
-import redis
 from pydantic import BaseSettings
 
 
@@ -16,6 +14,36 @@ class AppSettings(BaseSettings):
     re_host = 'cache'
     test_re_host = '127.0.0.1'
     re_port = 6379
+    re_max_connections: int = 50
+    re_pool_timeout: float = 5.0
+    re_socket_timeout: float = 2.0
+    re_connect_timeout: float = 2.0
+    re_health_check_interval: int = 30
+
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_pool_warmup: int = 2
+    db_statement_cache_size: int = 100
+    db_statement_cache_lifetime: int = 300
+    db_pgbouncer: bool = False
+
+    ping_timeout: float = 2.0
+    ping_cache_ttl: float = 1.0
+    ping_window: int = 1000
+
+    metrics_loop_lag_interval: float = 0.5
+
+    log_level: str = 'INFO'
+    log_json: bool = False
+    log_rotation: str = 'size'
+    log_max_bytes: int = 10 * 1024 * 1024
+    log_backup_count: int = 5
+    log_rotation_when: str = 'midnight'
+    log_debug_rate: int = 10
+    log_folder: str = 'logs'
 
     project_host: str = '0.0.0.0'
     project_port: int = 8000
@@ -24,9 +52,75 @@ class AppSettings(BaseSettings):
         f'@{db_host}:{db_port}/{db_name}'
     )
     algorithm: str = "sha256"
-    hmac_iteration = 10_000
+    hmac_iteration = 100_000
+    legacy_hmac_iteration = 10_000
+    password_hash_executor: str = 'thread'
+    password_hash_workers: int = 4
+    password_hash_concurrency: int = 8
     access_token_expire_minutes = 300
+    token_mode: str = 'db'
+    token_revocation_key: str = 'auth:revoked'
+    token_sweep_interval: float = 3600.0
+    token_sweep_batch: int = 1000
+    auth_cache_size: int = 10_000
+    auth_cache_ttl: float = 60.0
+    auth_cache_negative_ttl: float = 5.0
+    auth_cache_channel: str = 'auth:invalidate'
     file_folder = 'user_file'
+    upload_chunk_size: int = 1024 * 1024
+    max_upload_size: int = 0
+    blob_folder = 'user_file/.blobs'
+    storage_backend: str = 'local'
+    s3_endpoint_url: str = 'http://127.0.0.1:9000'
+    s3_bucket: str = 'files'
+    s3_region: str = 'us-east-1'
+    s3_access_key: str = ''
+    s3_secret_key: str = ''
+    s3_part_size: int = 8 * 1024 * 1024
+    s3_max_connections: int = 50
+    s3_timeout: float = 30.0
+    storage_compression: str = 'none'
+    storage_compression_level: int = 3
+    compression_min_size: int = 1024
+    compression_sample_size: int = 64 * 1024
+    compression_max_ratio: float = 0.9
+    compression_skip_types: set[str] = {'image', 'audio', 'video'}
+    response_compression: list[str] = ['br', 'zstd', 'gzip']
+    response_compression_level: int = 4
+    response_compression_min_size: int = 1024
+    incompressible_media_types: set[str] = {
+        'application/zip', 'application/x-zip-compressed', 'application/gzip',
+        'application/x-gzip', 'application/zstd', 'application/x-bzip2',
+        'application/x-xz', 'application/x-7z-compressed',
+        'application/x-rar-compressed', 'application/pdf',
+        'application/octet-stream',
+    }
+    blob_gc_interval: float = 3600.0
+    blob_gc_batch: int = 1000
+    batch_upload_concurrency: int = 16
+    # Части сессий лежат в хранилище blob под этим префиксом.
+    upload_session_prefix = 'sessions'
+    upload_part_size: int = 64 * 1024 * 1024
+    upload_session_ttl: int = 24 * 60 * 60
+    upload_session_sweep_interval: float = 3600.0
+    download_chunk_size: int = 1024 * 1024
+    file_meta_cache_ttl: int = 300
+    default_quota: int = 0
+    quota_reserve_ttl: int = 60 * 60
+    quota_reconcile_interval: float = 3600.0
+    quota_reconcile_batch: int = 1000
+    tree_max_depth: int = 10
+    tree_max_files: int = 1000
+    download_cache_control: str = 'private, no-cache'
+    list_cache_control: str = 'private, no-cache'
+    x_accel_redirect: bool = False
+    x_accel_location: str = '/protected-files'
+    zip_stored_extensions: set[str] = {
+        '.zip', '.gz', '.tgz', '.bz2', '.xz', '.zst', '.7z', '.rar',
+        '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic',
+        '.mp3', '.mp4', '.mkv', '.avi', '.mov', '.webm', '.ogg',
+        '.pdf', '.docx', '.xlsx', '.pptx',
+    }
     test_db_name = 'test_db'
     test_db_host = '127.0.0.1'
     test_db_port = 5555
@@ -44,8 +138,3 @@ class AppSettings(BaseSettings):
 
 app_settings = AppSettings()
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-
-re_cli = redis.Redis(host=app_settings.re_host, port=app_settings.re_port)
-if "pytest" in sys.modules:
-    re_cli = redis.Redis(
-        host=app_settings.test_re_host, port=app_settings.re_port)
@@ -1,23 +1,110 @@
+import atexit
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import time
+
+from core.config import app_settings
 
 LOG_FILE = 'file-server_log.log'
-path = os.getcwd() + '/' + 'logs'
-try:
-    os.mkdir(path)
-except FileExistsError:
-    pass
+path = os.path.join(os.getcwd(), app_settings.log_folder)
+os.makedirs(path, exist_ok=True)
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - один JSON-объект в строке."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает не больше rate записей DEBUG в секунду с одной строки."""
+
+    def __init__(self, rate: int) -> None:
+        super().__init__()
+        self.rate = rate
+        self._counts: dict[tuple[str, int], tuple[int, int]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate <= 0 or record.levelno > logging.DEBUG:
+            return True
+        key = (record.pathname, record.lineno)
+        second = int(time.monotonic())
+        window, count = self._counts.get(key, (second, 0))
+        if window != second:
+            window, count = second, 0
+        self._counts[key] = (window, count + 1)
+        return count < self.rate
+
+
+def create_file_handler() -> logging.Handler:
+    filename = path + '/' + LOG_FILE
+    if app_settings.log_rotation == 'size':
+        return logging.handlers.RotatingFileHandler(
+            filename=filename,
+            maxBytes=app_settings.log_max_bytes,
+            backupCount=app_settings.log_backup_count,
+            encoding='utf-8',
+            delay=True
+        )
+    if app_settings.log_rotation == 'time':
+        return logging.handlers.TimedRotatingFileHandler(
+            filename=filename,
+            when=app_settings.log_rotation_when,
+            backupCount=app_settings.log_backup_count,
+            encoding='utf-8',
+            delay=True
+        )
+    return logging.FileHandler(
+        filename=filename,
+        encoding='utf-8',
+        delay=True
+    )
+
+
 logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
-ch = logging.FileHandler(
-    filename=path + '/' + LOG_FILE,
-    mode='w',
-    encoding='utf-8',
-    delay=True
-)
-formatter: logging.Formatter = logging.Formatter(
+logger.setLevel(app_settings.log_level.upper())
+ch = create_file_handler()
+formatter: logging.Formatter = (
+    JsonFormatter if app_settings.log_json else logging.Formatter
+)(
     '%(asctime)s.%(msecs)03d - %(levelname)s - %(message)s',
     '%Y-%m-%d %H:%M:%S'
 )
 ch.setFormatter(formatter)
-logger.addHandler(ch)
+
+# Запись на диск идет в отдельном потоке, event loop только кладет
+# запись в очередь.
+log_queue: queue.SimpleQueue = queue.SimpleQueue()
+queue_handler = logging.handlers.QueueHandler(log_queue)
+queue_handler.addFilter(SamplingFilter(app_settings.log_debug_rate))
+logger.addHandler(queue_handler)
+listener = logging.handlers.QueueListener(
+    log_queue, ch, respect_handler_level=True)
+
+
+def start_log_listener() -> None:
+    """Запускает поток записи логов, если он еще не запущен."""
+    if listener._thread is None:
+        listener.start()
+
+
+def stop_log_listener() -> None:
+    """Дописывает накопленные записи и останавливает поток."""
+    if listener._thread is not None:
+        listener.stop()
+
+
+start_log_listener()
+atexit.register(stop_log_listener)
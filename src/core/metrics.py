@@ -0,0 +1,167 @@
+import asyncio
+import os
+import time
+from typing import Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess
+)
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core.config import app_settings
+
+# Воркеры uvicorn/gunicorn пишут метрики в общий каталог из
+# PROMETHEUS_MULTIPROC_DIR, а /metrics любого из них отдает сумму.
+MULTIPROCESS = 'PROMETHEUS_MULTIPROC_DIR' in os.environ
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds',
+    'HTTP request latency.',
+    ['method', 'route', 'status'],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    'http_requests_in_progress',
+    'HTTP requests being processed.',
+    ['method'],
+    multiprocess_mode='livesum',
+)
+REQUEST_BYTES = Counter(
+    'http_request_body_bytes',
+    'Bytes received in HTTP request bodies.',
+    ['route'],
+)
+RESPONSE_BYTES = Counter(
+    'http_response_body_bytes',
+    'Bytes sent in HTTP response bodies.',
+    ['route'],
+)
+DB_QUERY_LATENCY = Histogram(
+    'db_query_duration_seconds',
+    'SQL statement execution time.',
+    ['operation'],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5),
+)
+REDIS_COMMAND_LATENCY = Histogram(
+    'redis_command_duration_seconds',
+    'Redis command execution time.',
+    ['command'],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1),
+)
+EVENT_LOOP_LAG = Histogram(
+    'event_loop_lag_seconds',
+    'Delay of event loop callbacks over their schedule.',
+    buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5),
+)
+
+_lag_monitor: Optional[asyncio.Task] = None
+
+
+def route_name(scope: Scope) -> str:
+    """Шаблон пути маршрута, чтобы id в URL не плодили метки."""
+    route = scope.get('route')
+    return getattr(route, 'path', 'unmatched')
+
+
+class MetricsMiddleware:
+    """Считает задержку, объем тел запросов и ответов по маршрутам."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http' or scope['path'] == '/metrics':
+            await self.app(scope, receive, send)
+            return
+        method = scope['method']
+        status_code = 500
+        received = sent = 0
+
+        async def receive_counted() -> Message:
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+            return message
+
+        async def send_counted(message: Message) -> None:
+            nonlocal status_code, sent
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            elif message['type'] == 'http.response.body':
+                sent += len(message.get('body', b''))
+            await send(message)
+
+        # Маршрут известен только после роутинга, поэтому запросы
+        # в работе считаются по методу.
+        in_progress = REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive_counted, send_counted)
+        finally:
+            in_progress.dec()
+            route = route_name(scope)
+            REQUEST_LATENCY.labels(method, route, status_code).observe(
+                time.perf_counter() - start)
+            if received:
+                REQUEST_BYTES.labels(route).inc(received)
+            if sent:
+                RESPONSE_BYTES.labels(route).inc(sent)
+
+
+def observe_db_query(statement: str, duration: float) -> None:
+    operation = statement.lstrip().split(None, 1)[0].upper()
+    DB_QUERY_LATENCY.labels(operation).observe(duration)
+
+
+def observe_redis_command(command: str, duration: float) -> None:
+    REDIS_COMMAND_LATENCY.labels(command.upper()).observe(duration)
+
+
+async def monitor_event_loop() -> None:
+    interval = app_settings.metrics_loop_lag_interval
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(
+            max(0.0, time.perf_counter() - start - interval))
+
+
+def start_lag_monitor() -> None:
+    global _lag_monitor
+    if _lag_monitor is None:
+        _lag_monitor = asyncio.create_task(monitor_event_loop())
+
+
+async def stop_lag_monitor() -> None:
+    global _lag_monitor
+    if _lag_monitor is not None:
+        _lag_monitor.cancel()
+        try:
+            await _lag_monitor
+        except asyncio.CancelledError:
+            pass
+        _lag_monitor = None
+
+
+def mark_worker_dead() -> None:
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        data = generate_latest(registry)
+    else:
+        data = generate_latest()
+    return Response(data, media_type=CONTENT_TYPE_LATEST)
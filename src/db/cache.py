@@ -0,0 +1,59 @@
+import sys
+import time
+from typing import Optional
+
+from redis import asyncio as aioredis
+
+from core.config import app_settings
+from core.metrics import observe_redis_command
+
+
+class TimedRedis(aioredis.Redis):
+    """Клиент Redis, отдающий время выполнения команд в метрики."""
+
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            observe_redis_command(
+                str(args[0]), time.perf_counter() - start)
+
+
+redis_client: Optional[aioredis.Redis] = None
+
+
+def create_redis() -> aioredis.Redis:
+    host = app_settings.re_host
+    if "pytest" in sys.modules:
+        host = app_settings.test_re_host
+    pool = aioredis.BlockingConnectionPool(
+        host=host,
+        port=app_settings.re_port,
+        max_connections=app_settings.re_max_connections,
+        timeout=app_settings.re_pool_timeout,
+        socket_timeout=app_settings.re_socket_timeout,
+        socket_connect_timeout=app_settings.re_connect_timeout,
+        health_check_interval=app_settings.re_health_check_interval,
+    )
+    return TimedRedis(connection_pool=pool)
+
+
+async def init_redis() -> None:
+    global redis_client
+    if redis_client is None:
+        redis_client = create_redis()
+
+
+async def close_redis() -> None:
+    global redis_client
+    if redis_client is not None:
+        await redis_client.close()
+        await redis_client.connection_pool.disconnect()
+        redis_client = None
+
+
+def get_redis() -> aioredis.Redis:
+    if redis_client is None:
+        raise RuntimeError('Redis client is not initialized')
+    return redis_client
@@ -1,10 +1,16 @@
 import sys
+import time
 from typing import Any, AsyncGenerator
 
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from core.config import app_settings
+from core.logger import logger
+from core.metrics import observe_db_query
 
 Base: Any = declarative_base()
 
@@ -12,7 +18,78 @@ database_dsn = app_settings.database_dsn
 if "pytest" in sys.modules:
     database_dsn = app_settings.test_database
 
-engine = create_async_engine(database_dsn, future=True)
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Пул соединений, считающий время ожидания свободного соединения."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        # Время ожидания считается только по выданным соединениям.
+        wait = time.perf_counter() - start
+        self.checkouts += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        return connection
+
+    def recreate(self) -> 'TimedQueuePool':
+        pool = super().recreate()
+        pool.checkouts = self.checkouts
+        pool.timeouts = self.timeouts
+        pool.wait_total = self.wait_total
+        pool.wait_max = self.wait_max
+        return pool
+
+
+def create_engine():
+    url = make_url(database_dsn)
+    statement_cache_size = app_settings.db_statement_cache_size
+    if app_settings.db_pgbouncer:
+        # pgbouncer в режиме transaction не держит prepared statements.
+        statement_cache_size = 0
+    url = url.update_query_dict(
+        {'prepared_statement_cache_size': str(statement_cache_size)})
+    return create_async_engine(
+        url,
+        future=True,
+        poolclass=TimedQueuePool,
+        pool_size=app_settings.db_pool_size,
+        max_overflow=app_settings.db_max_overflow,
+        pool_timeout=app_settings.db_pool_timeout,
+        pool_recycle=app_settings.db_pool_recycle,
+        pool_pre_ping=app_settings.db_pool_pre_ping,
+        connect_args={
+            'statement_cache_size': statement_cache_size,
+            'max_cached_statement_lifetime': (
+                app_settings.db_statement_cache_lifetime),
+        },
+    )
+
+
+engine = create_engine()
+
+
+@event.listens_for(engine.sync_engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, many):
+    context.query_start = time.perf_counter()
+
+
+@event.listens_for(engine.sync_engine, 'after_cursor_execute')
+def stop_query_timer(conn, cursor, statement, parameters, context, many):
+    observe_db_query(statement, time.perf_counter() - context.query_start)
+
+
 async_session = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
@@ -21,3 +98,37 @@ async_session = sessionmaker(
 async def get_session() -> AsyncGenerator:
     async with async_session() as session:
         yield session
+
+
+async def warm_up_pool() -> None:
+    """Заранее открывает соединения, чтобы первые запросы их не ждали."""
+    count = min(app_settings.db_pool_warmup, app_settings.db_pool_size)
+    connections = []
+    try:
+        # По одному: первое подключение SQLAlchemy делает под блокировкой,
+        # параллельные подключения к новому пулу на ней зависают.
+        for _ in range(count):
+            connections.append(await engine.connect())
+    except (exc.SQLAlchemyError, OSError) as error:
+        logger.error(f'DB pool warm-up failed: {error}')
+    for connection in connections:
+        await connection.close()
+
+
+async def close_db() -> None:
+    await engine.dispose()
+
+
+def pool_stats() -> dict:
+    pool = engine.pool
+    return {
+        'size': pool.size(),
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        # Пока пул не заполнен, overflow() отрицателен.
+        'overflow': max(0, pool.overflow()),
+        'checkouts': pool.checkouts,
+        'timeouts': pool.timeouts,
+        'wait_avg': pool.wait_total / pool.checkouts if pool.checkouts else 0,
+        'wait_max': pool.wait_max,
+    }
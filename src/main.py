@@ -3,9 +3,29 @@ from fastapi import FastAPI
 from fastapi.responses import ORJSONResponse
 from fastapi_pagination import add_pagination
 
-from api.v1 import files, users
+from api.v1 import files, uploads, users
+from core.compression import CompressionMiddleware
 from core.config import app_settings
-from core.logger import logger
+from core.logger import logger, start_log_listener, stop_log_listener
+from core.metrics import (
+    MetricsMiddleware,
+    mark_worker_dead,
+    metrics_endpoint,
+    start_lag_monitor,
+    stop_lag_monitor
+)
+from db.cache import close_redis, init_redis
+from db.db import close_db, warm_up_pool
+from services.auth_cache import (
+    start_invalidation_listener,
+    stop_invalidation_listener
+)
+from services.blobs import start_garbage_collector, stop_garbage_collector
+from services.quotas import start_quota_reconciler, stop_quota_reconciler
+from services.storage import close_storage, init_storage
+from services.uploads import start_session_sweeper, stop_session_sweeper
+from services.users import start_token_sweeper, stop_token_sweeper
+from services.utils import shutdown_hash_executor
 
 app = FastAPI(
     title=app_settings.app_title,
@@ -15,8 +35,43 @@ app = FastAPI(
     redoc_url=None
 )
 
+
+@app.on_event('startup')
+async def startup() -> None:
+    start_log_listener()
+    await init_redis()
+    await warm_up_pool()
+    await init_storage()
+    start_invalidation_listener()
+    start_garbage_collector()
+    start_session_sweeper()
+    start_token_sweeper()
+    start_quota_reconciler()
+    start_lag_monitor()
+
+
+@app.on_event('shutdown')
+async def shutdown() -> None:
+    await stop_invalidation_listener()
+    await stop_garbage_collector()
+    await stop_session_sweeper()
+    await stop_token_sweeper()
+    await stop_quota_reconciler()
+    await stop_lag_monitor()
+    await close_redis()
+    await close_storage()
+    await close_db()
+    shutdown_hash_executor()
+    mark_worker_dead()
+    stop_log_listener()
+
+
 app.include_router(files.router, prefix='/api/v1', tags=['files'])
 app.include_router(users.router, prefix='/api/v1', tags=['users'])
+app.include_router(uploads.router, prefix='/api/v1', tags=['uploads'])
+app.add_route('/metrics', metrics_endpoint, include_in_schema=False)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 
 add_pagination(app)
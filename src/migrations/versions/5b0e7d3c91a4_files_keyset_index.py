@@ -0,0 +1,38 @@
+"""files-keyset-index
+
+Revision ID: 5b0e7d3c91a4
+Revises: 269ac2d3dc27
+Create Date: 2026-10-18 10:12:31.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b0e7d3c91a4'
+down_revision = '269ac2d3dc27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "UPDATE files SET created_at = now() AT TIME ZONE 'utc' "
+        "WHERE created_at IS NULL"
+    )
+    op.alter_column(
+        'files', 'created_at', existing_type=sa.DateTime(), nullable=False)
+    op.create_index(
+        'ix_files_author_created_at_id',
+        'files',
+        ['author', 'created_at', 'id'],
+        unique=False,
+        postgresql_include=['name', 'path', 'size', 'is_downloadable'],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_files_author_created_at_id', table_name='files')
+    op.alter_column(
+        'files', 'created_at', existing_type=sa.DateTime(), nullable=True)
@@ -0,0 +1,40 @@
+"""blob-storage
+
+Revision ID: 8f2a6c14d7e9
+Revises: 5b0e7d3c91a4
+Create Date: 2026-10-18 13:40:05.118904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f2a6c14d7e9'
+down_revision = '5b0e7d3c91a4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('blobs',
+    sa.Column('hash', sa.String(length=64), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('hash')
+    )
+    op.create_index(op.f('ix_blobs_ref_count'), 'blobs', ['ref_count'], unique=False)
+    op.add_column('files', sa.Column('hash', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_files_hash'), 'files', ['hash'], unique=False)
+    op.create_foreign_key('files_hash_fkey', 'files', 'blobs', ['hash'], ['hash'])
+    op.alter_column('files', 'size', existing_type=sa.Integer(), type_=sa.BigInteger())
+
+
+def downgrade() -> None:
+    op.alter_column('files', 'size', existing_type=sa.BigInteger(), type_=sa.Integer())
+    op.drop_constraint('files_hash_fkey', 'files', type_='foreignkey')
+    op.drop_index(op.f('ix_files_hash'), table_name='files')
+    op.drop_column('files', 'hash')
+    op.drop_index(op.f('ix_blobs_ref_count'), table_name='blobs')
+    op.drop_table('blobs')
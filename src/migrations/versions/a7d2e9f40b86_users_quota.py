@@ -0,0 +1,24 @@
+"""users-quota
+
+Revision ID: a7d2e9f40b86
+Revises: f3b84d6e1c27
+Create Date: 2026-10-18 23:02:17.448203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d2e9f40b86'
+down_revision = 'f3b84d6e1c27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('quota', sa.BigInteger(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'quota')
@@ -0,0 +1,55 @@
+"""files-unique-path
+
+Revision ID: c47d1e9a2b30
+Revises: 8f2a6c14d7e9
+Create Date: 2026-10-18 15:02:47.530216
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47d1e9a2b30'
+down_revision = '8f2a6c14d7e9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Путь раньше писался как пришел: '/dir', 'dir/' и 'dir' - одна
+    # папка. Приводим к виду normalize_path до поиска дублей.
+    op.execute(sa.text(
+        """
+        UPDATE files SET path = CASE
+            WHEN trim(both '/' from coalesce(path, '')) = '.' THEN ''
+            ELSE trim(both '/' from coalesce(path, ''))
+        END
+        WHERE path IS NULL OR path LIKE '/%' OR path LIKE '%/' OR path = '.'
+        """
+    ))
+    # Раньше один путь мог быть записан несколько раз: оставляем
+    # последнюю запись и отпускаем ссылки удаленных на blob.
+    op.execute(sa.text(
+        """
+        WITH removed AS (
+            DELETE FROM files AS old USING files AS new
+            WHERE old.author = new.author
+              AND old.path = new.path
+              AND old.name = new.name
+              AND old.id < new.id
+            RETURNING old.hash
+        )
+        UPDATE blobs SET ref_count = blobs.ref_count - removed_blobs.count
+        FROM (
+            SELECT hash, count(*) AS count FROM removed
+            WHERE hash IS NOT NULL GROUP BY hash
+        ) AS removed_blobs
+        WHERE blobs.hash = removed_blobs.hash
+        """
+    ))
+    op.create_index('uq_files_author_path_name', 'files', ['author', 'path', 'name'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('uq_files_author_path_name', table_name='files')
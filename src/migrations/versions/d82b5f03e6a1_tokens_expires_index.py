@@ -0,0 +1,24 @@
+"""tokens-expires-index
+
+Revision ID: d82b5f03e6a1
+Revises: c47d1e9a2b30
+Create Date: 2026-10-18 19:41:12.904377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd82b5f03e6a1'
+down_revision = 'c47d1e9a2b30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(op.f('ix_tokens_expires'), 'tokens', ['expires'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_tokens_expires'), table_name='tokens')
@@ -0,0 +1,30 @@
+"""blob-compression
+
+Revision ID: e5a9c7210f4b
+Revises: d82b5f03e6a1
+Create Date: 2026-10-18 21:07:35.116842
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a9c7210f4b'
+down_revision = 'd82b5f03e6a1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    for table in ('blobs', 'files'):
+        op.add_column(table, sa.Column('stored_size', sa.BigInteger(), nullable=True))
+        op.add_column(table, sa.Column('encoding', sa.String(length=16), nullable=True))
+        # Все blob до этой ревизии хранятся без сжатия.
+        op.execute(f'UPDATE {table} SET stored_size = size')
+
+
+def downgrade() -> None:
+    for table in ('files', 'blobs'):
+        op.drop_column(table, 'encoding')
+        op.drop_column(table, 'stored_size')
@@ -0,0 +1,54 @@
+"""folders
+
+Revision ID: f3b84d6e1c27
+Revises: e5a9c7210f4b
+Create Date: 2026-10-18 22:14:51.603918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b84d6e1c27'
+down_revision = 'e5a9c7210f4b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('folders',
+    sa.Column('author', sa.Integer(), nullable=False),
+    sa.Column('path', sa.String(length=100), nullable=False),
+    sa.Column('parent', sa.String(length=100), nullable=True),
+    sa.Column('depth', sa.Integer(), nullable=False),
+    sa.Column('file_count', sa.Integer(), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['author'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('author', 'path')
+    )
+    op.create_index('ix_folders_author_depth_path', 'folders', ['author', 'depth', 'path'], unique=False, postgresql_ops={'path': 'varchar_pattern_ops'})
+    # Каждый файл учитывается в своей папке и во всех ее предках.
+    # Путь обрезается от слешей, как в normalize_path: иначе '/a' дает
+    # пустой первый элемент и две строки с путем ''.
+    op.execute("""
+        INSERT INTO folders (author, path, parent, depth, file_count, size)
+        SELECT
+            files.author,
+            array_to_string(parts[1:level], '/'),
+            CASE WHEN level > 0
+                THEN array_to_string(parts[1:level - 1], '/') END,
+            level,
+            count(*),
+            coalesce(sum(files.size), 0)
+        FROM files
+        CROSS JOIN LATERAL string_to_array(
+            trim(both '/' from coalesce(files.path, '')), '/') AS parts
+        CROSS JOIN LATERAL generate_series(0, cardinality(parts)) AS level
+        GROUP BY 1, 2, 3, 4
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_folders_author_depth_path', table_name='folders')
+    op.drop_table('folders')
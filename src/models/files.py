@@ -1,6 +1,15 @@
 from datetime import datetime
 
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String
+)
 from sqlalchemy.orm import relationship
 
 from db.db import Base
@@ -10,11 +19,61 @@ class FileModel(Base):
     __tablename__ = 'files'
     id = Column(Integer, primary_key=True)
     name = Column(String(50))
-    created_at = Column(DateTime, index=True, default=datetime.utcnow)
+    created_at = Column(
+        DateTime, index=True, default=datetime.utcnow, nullable=False)
     path = Column(String(100))
-    size = Column(Integer)
+    size = Column(BigInteger)
+    stored_size = Column(BigInteger)
+    encoding = Column(String(16))
     is_downloadable = Column(Boolean)
+    hash = Column(String(64), ForeignKey('blobs.hash'), index=True)
     author = Column(
         Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
     )
     user = relationship('UsersTable', back_populates='files')
+
+    __table_args__ = (
+        Index(
+            'ix_files_author_created_at_id',
+            'author', 'created_at', 'id',
+            postgresql_include=['name', 'path', 'size', 'is_downloadable'],
+        ),
+        Index(
+            'uq_files_author_path_name',
+            'author', 'path', 'name',
+            unique=True,
+        ),
+    )
+
+
+class BlobModel(Base):
+    __tablename__ = 'blobs'
+    hash = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    stored_size = Column(BigInteger)
+    encoding = Column(String(16))
+    ref_count = Column(Integer, nullable=False, default=0, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class FolderModel(Base):
+    """Папка пользователя с числом и объемом файлов во всем поддереве."""
+    __tablename__ = 'folders'
+    author = Column(
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    path = Column(String(100), primary_key=True)
+    parent = Column(String(100))
+    depth = Column(Integer, nullable=False)
+    file_count = Column(Integer, nullable=False, default=0)
+    size = Column(BigInteger, nullable=False, default=0)
+
+    __table_args__ = (
+        Index(
+            'ix_folders_author_depth_path',
+            'author', 'depth', 'path',
+            postgresql_ops={'path': 'varchar_pattern_ops'},
+        ),
+    )
@@ -1,4 +1,5 @@
 from sqlalchemy import (
+    BigInteger,
     Boolean,
     Column,
     DateTime,
@@ -23,6 +24,8 @@ class UsersTable(Base):
         default=True,
         nullable=False,
     )
+    # Лимит в байтах: NULL - общий из настроек, 0 - без ограничений.
+    quota = Column(BigInteger)
     tokens = relationship(
         'TokensTable', back_populates="user", passive_deletes=True
     )
@@ -41,7 +44,7 @@ class TokensTable(Base):
         nullable=False,
         index=True,
     )
-    expires = Column(DateTime())
+    expires = Column(DateTime(), index=True)
     user_id = Column(
         Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
     )
@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class FileBase(BaseModel):
@@ -35,7 +35,57 @@ class FileInDB(FileInDBBase):
     pass
 
 
+class FileMeta(FileInDBBase):
+    hash: Optional[str] = None
+    stored_size: Optional[int] = None
+    encoding: Optional[str] = None
+
+
+class FolderNode(BaseModel):
+    path: str
+    name: str
+    file_count: int
+    size: int
+    children: list['FolderNode'] = []
+
+
+class FolderTree(FolderNode):
+    files: list[FileInDB] = []
+
+
+FolderNode.update_forward_refs()
+
+
 class UploadResponse(BaseModel):
     Ready: Optional[str] = None
     Size: Optional[str] = None
     Error: Optional[str] = None
+
+
+class BatchUploadItem(BaseModel):
+    name: str
+    id: Optional[int] = None
+    size: Optional[int] = None
+    hash: Optional[str] = None
+    error: Optional[str] = None
+
+
+class UploadSessionCreate(BaseModel):
+    path: str
+    name: str
+    size: Optional[int] = Field(default=None, ge=0)
+
+
+class UploadSession(BaseModel):
+    id: str
+    path: str
+    name: str
+    size: Optional[int]
+    part_size: int
+    parts: list[int]
+    received: int
+
+
+class UploadPart(BaseModel):
+    number: int
+    size: int
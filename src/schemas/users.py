@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Optional
 
-from pydantic import UUID4, BaseModel, Field, validator
+from pydantic import BaseModel, Field, validator
 
 
 class BaseWithORM(BaseModel):
@@ -14,6 +14,13 @@ class BaseWithORM(BaseModel):
 class UserCreate(BaseWithORM):
     password: str
 
+    @validator('name')
+    def name_is_folder_safe(cls, value):
+        """Имя используется как имя папки пользователя."""
+        if not value or value.startswith('.') or '/' in value:
+            raise ValueError('Invalid user name')
+        return value
+
 
 class UserInDB(BaseWithORM):
     hashed_password: str
@@ -27,8 +34,14 @@ class UserRedis(UserBase):
     is_active: bool
 
 
+class QuotaUsage(BaseModel):
+    used: int
+    reserved: int
+    quota: Optional[int]
+
+
 class UserToken(BaseModel):
-    token: UUID4 = Field(..., alias="access_token")
+    token: str = Field(..., alias="access_token")
     expires: datetime
     token_type: Optional[str] = 'bearer'
 
@@ -0,0 +1,72 @@
+from datetime import datetime
+from pathlib import PurePosixPath
+from typing import AsyncIterator, Callable, Iterable, NamedTuple
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile, ZipInfo
+
+from fastapi.concurrency import run_in_threadpool
+
+from core.config import app_settings
+
+
+class ZipStream:
+    """Неперематываемый буфер, в который пишет ZipFile.
+
+    Отсутствие seek() заставляет ZipFile писать data descriptor после
+    каждого файла, поэтому готовые байты можно сразу отдавать клиенту.
+    """
+
+    def __init__(self) -> None:
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def pop(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def compress_type(name: str) -> int:
+    """Уже сжатые форматы кладутся в архив без компрессии."""
+    suffix = PurePosixPath(name).suffix.lower()
+    if suffix in app_settings.zip_stored_extensions:
+        return ZIP_STORED
+    return ZIP_DEFLATED
+
+
+class ZipEntry(NamedTuple):
+    name: str
+    size: int
+    modified: datetime
+    read: Callable[[], AsyncIterator[bytes]]
+
+
+async def stream_zip(entries: Iterable[ZipEntry]) -> AsyncIterator[bytes]:
+    """Отдает ZIP64-архив по мере его формирования."""
+    buffer = ZipStream()
+    with ZipFile(buffer, 'w', allowZip64=True) as archive:
+        for entry in entries:
+            info = ZipInfo(
+                entry.name, date_time=entry.modified.timetuple()[:6])
+            info.file_size = entry.size
+            info.compress_type = compress_type(entry.name)
+            info.external_attr = 0o644 << 16
+            with archive.open(info, 'w') as dest:
+                async for chunk in entry.read():
+                    await run_in_threadpool(dest.write, chunk)
+                    if data := buffer.pop():
+                        yield data
+            if data := buffer.pop():
+                yield data
+    if data := buffer.pop():
+        yield data
@@ -0,0 +1,146 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from core.config import app_settings
+from core.logger import logger
+from db.cache import get_redis
+from schemas.users import UserRedis
+
+from .tokens import remember_revoked, sync_revocations
+
+INVALIDATE_ALL = '*'
+# Сколько ждать сообщения в канале за одно чтение, секунды.
+LISTEN_TIMEOUT = 1.0
+
+
+class AuthCache:
+    """LRU-кэш токенов с TTL, живущий внутри процесса воркера.
+
+    Значение ``None`` означает негативную запись: токен неизвестен.
+    """
+
+    def __init__(self, max_size: int, ttl: float, negative_ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: OrderedDict[
+            str, tuple[float, Optional[UserRedis]]] = OrderedDict()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, token: str) -> tuple[bool, Optional[UserRedis]]:
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return False, None
+        deadline, user = entry
+        if deadline <= time.time():
+            del self._entries[token]
+            self.misses += 1
+            return False, None
+        self._entries.move_to_end(token)
+        if user is None:
+            self.negative_hits += 1
+        else:
+            self.hits += 1
+        return True, user
+
+    def set(self, token: str, user: UserRedis, expires: float) -> None:
+        self._put(token, user, min(time.time() + self.ttl, expires))
+
+    def set_missing(self, token: str) -> None:
+        self._put(token, None, time.time() + self.negative_ttl)
+
+    def invalidate(self, token: str) -> None:
+        if token == INVALIDATE_ALL:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+        elif self._entries.pop(token, None) is not None:
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+    def _put(
+        self,
+        token: str,
+        user: Optional[UserRedis],
+        deadline: float
+    ) -> None:
+        if self.max_size <= 0 or deadline <= time.time():
+            return
+        self._entries[token] = (deadline, user)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+auth_cache = AuthCache(
+    max_size=app_settings.auth_cache_size,
+    ttl=app_settings.auth_cache_ttl,
+    negative_ttl=app_settings.auth_cache_negative_ttl,
+)
+_listener: Optional[asyncio.Task] = None
+
+
+async def publish_invalidation(token: str) -> None:
+    """Сбрасывает токен в кэше всех воркеров."""
+    auth_cache.invalidate(token)
+    await get_redis().publish(app_settings.auth_cache_channel, token)
+
+
+async def listen_invalidations() -> None:
+    while True:
+        try:
+            async with get_redis().pubsub() as pubsub:
+                await pubsub.subscribe(app_settings.auth_cache_channel)
+                # Пропущенные за время переподключения сообщения не придут.
+                auth_cache.invalidate(INVALIDATE_ALL)
+                await sync_revocations()
+                while True:
+                    # listen() упирается в socket_timeout пула и падает
+                    # на тихом канале; get_message ждет сам и отдает None.
+                    message = await pubsub.get_message(
+                        ignore_subscribe_messages=True,
+                        timeout=LISTEN_TIMEOUT
+                    )
+                    if message is None or message['type'] != 'message':
+                        continue
+                    token = message['data'].decode()
+                    auth_cache.invalidate(token)
+                    remember_revoked(token)
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            logger.error(f'Auth cache listener: {error}')
+            await asyncio.sleep(1)
+
+
+def start_invalidation_listener() -> None:
+    global _listener
+    if _listener is None:
+        _listener = asyncio.create_task(listen_invalidations())
+
+
+async def stop_invalidation_listener() -> None:
+    global _listener
+    if _listener is not None:
+        # redis-py 4.3 иногда теряет отмену внутри чтения pubsub,
+        # поэтому отмена повторяется, пока задача не завершится.
+        while not _listener.done():
+            _listener.cancel()
+            await asyncio.wait({_listener}, timeout=0.1)
+        _listener = None
@@ -1,28 +1,83 @@
+import asyncio
+import hashlib
 import json
-import os
+import time
+from collections import Counter
 from datetime import datetime, timedelta
-from io import BytesIO
-from pathlib import Path
-from typing import Generic, Optional, Type, TypeVar, Union
-from zipfile import ZipFile
+from pathlib import Path, PurePosixPath
+from functools import partial
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Generic,
+    Optional,
+    Type,
+    TypeVar,
+    Union
+)
+from uuid import UUID, uuid4
 
 import aiofiles
-from fastapi import File, HTTPException, status, UploadFile
+import aiofiles.os
+from fastapi import (
+    File,
+    HTTPException,
+    Request,
+    Response,
+    status,
+    UploadFile
+)
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import StreamingResponse
+from fastapi_pagination.bases import AbstractPage
+from fastapi_pagination.ext.async_sqlalchemy import paginate
 from pydantic import BaseModel
-from sqlalchemy import and_, exc, select
+from sqlalchemy import (
+    and_,
+    bindparam,
+    delete,
+    exc,
+    insert,
+    or_,
+    select,
+    update
+)
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
 
-from core.config import app_settings, re_cli
+from core.config import app_settings
 from core.logger import logger
+from db.cache import get_redis
 from db.db import Base
 from models.users import TokensTable, UsersTable
+from schemas.files import FileMeta
+from schemas.users import UserRedis
 
-from .utils import hash_password, user_obj
+from .archive import ZipEntry, stream_zip
+from .auth_cache import auth_cache
+from .blobs import BULK_CHUNK, TempBlob, blob_key, blobs_crud
+from .compression import Encoder, read_decoded
+from .conditional import bump_files_version
+from .folders import folders_crud
+from .quotas import quotas
+from .responses import blob_response, content_disposition, file_response
+from .storage import read_local, storage
+from .tokens import is_signed_token, user_from_signed_token
+from .utils import (
+    hash_password_async,
+    normalize_path,
+    remove_silently,
+    user_obj,
+    user_str
+)
 
 ModelType = TypeVar("ModelType", bound=Base)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
+# Меняет размер резерва квоты, см. QuotaCounters.reserved.
+Reserve = Callable[[int], Awaitable[None]]
+
+META_PREFIX = 'files:meta'
 
 
 class RepositoryDBUser(Generic[ModelType, CreateSchemaType]):
@@ -35,7 +90,8 @@ class RepositoryDBUser(Generic[ModelType, CreateSchemaType]):
         obj_in: CreateSchemaType
     ) -> ModelType:
         obj_in_data = jsonable_encoder(obj_in)
-        hashed_password = hash_password(obj_in_data.pop('password'))
+        hashed_password = await hash_password_async(
+            obj_in_data.pop('password'))
         obj_in_data['hashed_password'] = hashed_password
         db_obj = self._user_model(**obj_in_data)
         db.add(db_obj)
@@ -64,26 +120,57 @@ class RepositoryDBUser(Generic[ModelType, CreateSchemaType]):
         user = await db.execute(statement=statement)
         return user.scalar_one_or_none()
 
+    async def update_password(
+        self,
+        db: AsyncSession,
+        user: ModelType,
+        hashed_password: str
+    ) -> None:
+        user.hashed_password = hashed_password
+        try:
+            await db.commit()
+        except exc.SQLAlchemyError as error:
+            logger.error(error)
+            await db.rollback()
+
     async def get_user_by_token(
         self,
         db: AsyncSession,
         token: str
-    ) -> Optional[ModelType]:
-        from_redis = json.loads(re_cli.get(token))
-        if from_redis:
-            if datetime.utcfromtimestamp(
-                from_redis.get('expires')
-            ) > datetime.now():
-                return user_obj(from_redis.get('user'))
-            re_cli.delete(token)
-        query = select(self._user_model).join(TokensTable).where(
+    ) -> Optional[UserRedis]:
+        if is_signed_token(token):
+            return user_from_signed_token(token)
+        try:
+            UUID(token)
+        except ValueError:
+            # Непрозрачные токены - UUID, остальное в БД не отправляем.
+            return None
+        found, cached_user = auth_cache.get(token)
+        if found:
+            return cached_user
+        cache = get_redis()
+        cached = await cache.get(token)
+        if cached:
+            from_redis = json.loads(cached)
+            if from_redis.get('expires') > time.time():
+                user = user_obj(from_redis.get('user'))
+                auth_cache.set(token, user, from_redis.get('expires'))
+                return user
+            await cache.delete(token)
+        query = select(self._user_model, TokensTable.expires).join(
+            TokensTable).where(
             and_(
                 TokensTable.token == token,
                 TokensTable.expires > datetime.now()
             )
         )
-        user = await db.execute(query)
-        return user.scalar_one_or_none()
+        row = (await db.execute(query)).first()
+        if row is None:
+            auth_cache.set_missing(token)
+            return None
+        user = user_obj(user_str(row[0]))
+        auth_cache.set(token, user, row[1].timestamp())
+        return user
 
 
 class RepositoryDBToken(Generic[ModelType, CreateSchemaType]):
@@ -110,186 +197,597 @@ class RepositoryDBToken(Generic[ModelType, CreateSchemaType]):
             )
         return db_obj
 
+    async def delete_expired(self, db: AsyncSession, limit: int) -> int:
+        """Удаляет пачку истекших токенов, возвращает их число."""
+        expired = select(self._token_model.id).where(
+            self._token_model.expires < datetime.now()
+        ).limit(limit)
+        result = await db.execute(
+            delete(self._token_model).where(
+                self._token_model.id.in_(expired.scalar_subquery())
+            ).execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        return result.rowcount
+
+    async def revoke_token(
+        self,
+        db: AsyncSession,
+        token: str
+    ) -> None:
+        statement = update(self._token_model).where(
+            self._token_model.token == token
+        ).values(expires=datetime.now())
+        try:
+            await db.execute(statement)
+            await db.commit()
+        except exc.SQLAlchemyError as error:
+            logger.error(error)
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+
 
 class RepositoryDBFile(Generic[ModelType, CreateSchemaType]):
     def __init__(self, model: Type[ModelType]) -> None:
         self._model = model
 
-    async def get(
-            self,
-            db: AsyncSession,
-            user: UsersTable
-    ) -> list:
-        statement = (
-            select(self._model)
-            .where(
-                self._model.author == user.id
+    def list_statement(self, user: UsersTable) -> Select:
+        return (
+            select(
+                self._model.id,
+                self._model.name,
+                self._model.created_at,
+                self._model.path,
+                self._model.size,
+                self._model.is_downloadable,
             )
+            .where(self._model.author == user.id)
+            .order_by(self._model.created_at, self._model.id)
         )
-        result = await db.scalars(statement=statement)
-        logger.debug(str(result))
-        return result.all()
 
-    async def get_path_by_id(
-        self,
-        db: AsyncSession,
-        user: ModelType,
-        id: int
-    ) -> str:
-        statement = select(self._model).where(self._model.id == id)
-        file = await db.scalar(statement=statement)
-        full_path = (
-            f'{app_settings.file_folder}/{user.name}/{file.path}/{file.name}'
-        )
-        logger.info(file.name)
-        return full_path
+    async def list_folder(
+            self,
+            db: AsyncSession,
+            user: UsersTable,
+            path: str,
+            limit: int
+    ) -> list:
+        """Файлы, лежащие прямо в папке, по индексу (автор, путь, имя)."""
+        statement = self.list_statement(user).where(
+            self._model.path == path
+        ).order_by(None).order_by(self._model.name).limit(limit)
+        return (await db.execute(statement)).all()
 
-    async def get_file_by_id(
-        self,
-        db: AsyncSession,
-        user: UsersTable,
-        id: int
-    ) -> File:
-        path = await self.get_path_by_id(db=db, id=id, user=user)
-        if os.path.exists(path) and os.path.isfile(path):
-            return FileResponse(path=path)
-        raise HTTPException(
-            status_code=404, detail="Item not found"
-        )
+    async def get_page(
+            self,
+            db: AsyncSession,
+            user: UsersTable
+    ) -> AbstractPage:
+        return await paginate(db, self.list_statement(user))
 
     @staticmethod
-    async def get_file_by_path(user: UsersTable, path: Path) -> File:
-        logger.info(path)
-        full_path = f'{app_settings.file_folder}/{user.name}/{path}'
-        if os.path.exists(path) and os.path.isfile(path):
-            return FileResponse(path=full_path)
-        raise HTTPException(
-            status_code=404, detail="Item not found"
-        )
+    def legacy_path(user: UsersTable, file: ModelType) -> Path:
+        """Путь файла, загруженного до появления хранилища blob."""
+        return Path(app_settings.file_folder, user.name, file.path, file.name)
+
+    def reader(
+            self,
+            user: UsersTable,
+            file: ModelType
+    ) -> Callable[[], AsyncIterator[bytes]]:
+        if file.hash is None:
+            return partial(read_local, self.legacy_path(user, file))
+        read = partial(storage.read, blob_key(file.hash))
+        if file.encoding is not None:
+            return partial(read_decoded, read, file.encoding)
+        return read
 
     async def download_file(
             self,
             db: AsyncSession,
+            request: Request,
             user: UsersTable,
             identifier: Union[str, int],
-    ) -> File:
-        try:
-            int(identifier)
-            logger.info(f'{identifier} is int')
-            file = await self.get_file_by_id(
-                db=db,
-                user=user,
-                id=int(identifier),
-            )
-        except ValueError:
-            logger.info(identifier)
-            file = await self.get_file_by_path(
-                user=user,
-                path=Path(identifier),
+    ) -> Response:
+        file = await self.get_meta(db=db, user=user, identifier=identifier)
+        if file is None:
+            raise HTTPException(
+                status_code=404, detail="Item not found"
             )
-        return file
+        logger.info(f'Download {file.id}: {file.path}/{file.name}')
+        if file.hash is None:
+            return await file_response(
+                request=request, path=self.legacy_path(user, file))
+        return blob_response(request=request, file=file)
 
     @staticmethod
-    def zip_folder(file_list: list) -> File:
-        io = BytesIO()
-        zip_name = f'{str(datetime.now())}.zip'
-        with ZipFile(io, 'w') as zip:
-            for file in file_list:
-                zip.write(file)
+    def zip_folder(name: str, entries: list[ZipEntry]) -> File:
+        zip_name = f'{name or "files"}.zip'
         return StreamingResponse(
-            iter([io.getvalue()]),
+            stream_zip(entries),
             media_type='application/x-zip-compressed',
-            headers={'Content-Disposition': f'attachment filename={zip_name}'}
+            headers={'Content-Disposition': content_disposition(zip_name)}
         )
 
     async def download_folder(
             self,
+            db: AsyncSession,
             user: UsersTable,
             path: str,
     ) -> File:
-        full_path = f'{app_settings.file_folder}/{user.name}/{path}'
-        file_list = [
-            f'{full_path}/{file.name}' for file in list(
-                Path(full_path).iterdir()
+        path = normalize_path(path)
+        statement = select(self._model).where(
+            self._model.author == user.id
+        ).order_by(self._model.path, self._model.name)
+        if path:
+            statement = statement.where(or_(
+                self._model.path == path,
+                self._model.path.startswith(f'{path}/', autoescape=True)
+            ))
+        files = (await db.scalars(statement)).all()
+        if not files:
+            raise HTTPException(
+                status_code=404, detail="Item not found"
+            )
+        entries = [
+            ZipEntry(
+                name=str(PurePosixPath(
+                    file.path[len(path):].lstrip('/'), file.name)),
+                size=file.size,
+                modified=file.created_at,
+                read=self.reader(user, file),
             )
+            for file in files
         ]
-        archive = self.zip_folder(file_list)
-        return archive
+        return self.zip_folder(PurePosixPath(path).name, entries)
 
-    async def create_in_db(
+    @staticmethod
+    def parse_identifier(
+            identifier: Union[str, int]
+    ) -> Union[int, tuple[str, str]]:
+        """Id файла или пара (папка, имя) для пути."""
+        try:
+            return int(identifier)
+        except ValueError:
+            file_path = PurePosixPath(str(identifier).strip('/'))
+            return normalize_path(str(file_path.parent)), file_path.name
+
+    async def get_by_identifier(
             self,
-            size: int,
             db: AsyncSession,
             user: UsersTable,
-            path: str,
+            identifier: Union[str, int],
+            for_update: bool = False,
+    ) -> Optional[ModelType]:
+        """Файл по id или пути; for_update блокирует строку до commit."""
+        parsed = self.parse_identifier(identifier)
+        if isinstance(parsed, int):
+            condition = self._model.id == parsed
+        else:
+            condition = and_(
+                self._model.path == parsed[0],
+                self._model.name == parsed[1]
+            )
+        statement = select(self._model).where(
+            self._model.author == user.id, condition)
+        if for_update:
+            # Перечитываем строку, даже если объект уже есть в сессии.
+            statement = statement.with_for_update().execution_options(
+                populate_existing=True)
+        return await db.scalar(statement)
+
+    @staticmethod
+    def meta_key(
+            user_id: int,
+            parsed: Union[int, tuple[str, str]]
+    ) -> str:
+        if isinstance(parsed, int):
+            return f'{META_PREFIX}:{user_id}:id:{parsed}'
+        return f'{META_PREFIX}:{user_id}:path:{parsed[0]}/{parsed[1]}'
+
+    async def get_meta(
+            self,
+            db: AsyncSession,
+            user: UsersTable,
+            identifier: Union[str, int],
+    ) -> Optional[FileMeta]:
+        """Метаданные файла: сначала из Redis, при промахе - из БД."""
+        key = self.meta_key(user.id, self.parse_identifier(identifier))
+        cache = get_redis()
+        cached = await cache.get(key)
+        if cached is not None:
+            return FileMeta.parse_raw(cached)
+        file = await self.get_by_identifier(
+            db=db, user=user, identifier=identifier)
+        if file is None:
+            return None
+        meta = FileMeta.from_orm(file)
+        await cache.set(key, meta.json(), ex=app_settings.file_meta_cache_ttl)
+        return meta
+
+    async def forget_meta(
+            self,
+            user: UsersTable,
+            files: list[tuple[int, str, str]]
+    ) -> None:
+        """Сбрасывает кэш метаданных по id, папке и имени файлов."""
+        keys = [
+            key for file_id, path, name in files
+            for key in (
+                self.meta_key(user.id, file_id),
+                self.meta_key(user.id, (path, name)),
+            )
+        ]
+        if keys:
+            await get_redis().delete(*keys)
+
+    @staticmethod
+    async def write_file(
             file: UploadFile = File(),
-    ) -> ModelType:
-        db_obj = self._model(
-            name=file.filename,
-            path=path,
+    ) -> TempBlob:
+        """Пишет загрузку во временный файл, считая размер и SHA-256.
+
+        Сжимаемое содержимое пишется уже сжатым, хеш считается
+        по исходным байтам.
+        """
+        tmp_folder = Path(app_settings.blob_folder, 'tmp')
+        tmp_path = Path(tmp_folder, f'.{uuid4().hex}.part')
+        checksum = hashlib.sha256()
+        encoder = Encoder(file.filename)
+        size = 0
+        try:
+            await aiofiles.os.makedirs(tmp_folder, exist_ok=True)
+            async with aiofiles.open(tmp_path, 'wb') as f:
+                logger.debug(f)
+                while chunk := await file.read(app_settings.upload_chunk_size):
+                    size += len(chunk)
+                    if (
+                        app_settings.max_upload_size
+                        and size > app_settings.max_upload_size
+                    ):
+                        raise HTTPException(
+                            status_code=(
+                                status.HTTP_413_REQUEST_ENTITY_TOO_LARGE),
+                            detail='File too large'
+                        )
+                    checksum.update(chunk)
+                    await f.write(await encoder.encode(chunk))
+                await f.write(encoder.flush())
+        except HTTPException:
+            await remove_silently(tmp_path)
+            raise
+        except Exception as ex:
+            logger.error(ex)
+            await remove_silently(tmp_path)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail='File not saved'
+            )
+        return TempBlob(
+            path=tmp_path,
             size=size,
-            is_downloadable=True,
-            author=user.id
+            checksum=checksum.hexdigest(),
+            encoding=encoder.encoding,
+            stored_size=encoder.stored_size,
         )
-        db.add(db_obj)
+
+    async def publish(
+            self,
+            db: AsyncSession,
+            user: UsersTable,
+            path: str,
+            name: str,
+            blob: TempBlob,
+    ) -> ModelType:
+        """Переносит готовый временный файл в хранилище и пишет его в БД."""
         try:
+            # Старый хеш и размер берутся из заблокированной строки, иначе
+            # параллельная перезапись освободит один блоб дважды.
+            db_obj = await self.get_by_identifier(
+                db=db, user=user, identifier=f'{path}/{name}',
+                for_update=True)
+            encoding, stored_size = await blobs_crud.acquire(db=db, blob=blob)
+            if db_obj is None:
+                db_obj = self._model(
+                    name=name,
+                    path=path,
+                    author=user.id
+                )
+                db.add(db_obj)
+                change = (1, blob.size)
+            else:
+                if db_obj.hash is not None:
+                    await blobs_crud.release(db=db, checksum=db_obj.hash)
+                # Новое содержимое - новый Last-Modified.
+                db_obj.created_at = datetime.utcnow()
+                change = (0, blob.size - (db_obj.size or 0))
+            await folders_crud.apply(
+                db=db, author=user.id, changes={path: change})
+            db_obj.size = blob.size
+            db_obj.stored_size = stored_size
+            db_obj.encoding = encoding
+            db_obj.hash = blob.checksum
+            db_obj.is_downloadable = True
             await db.commit()
             await db.refresh(db_obj)
         except exc.SQLAlchemyError as error:
-            logger.error(error)
+            await self.discard(db, [blob], error)
             raise HTTPException(
                 status_code=status.HTTP_422_UNPROCESSABLE_ENTITY
             )
+        except OSError as error:
+            await self.discard(db, [blob], error)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail='File not saved'
+            )
+        await self.forget_meta(user, [(db_obj.id, path, name)])
+        await bump_files_version(user.id)
+        await quotas.adjust(user.id, change[1])
         return db_obj
 
-    @staticmethod
-    async def write_file(
+    async def create(
+            self,
+            db: AsyncSession,
             user: UsersTable,
             path: str,
             file: UploadFile = File(),
+            reserve: Optional[Reserve] = None,
+    ) -> dict:
+        path = normalize_path(path)
+        blob = await self.write_file(file=file)
+        await self.reserve_written(reserve, [blob])
+        logger.info(
+            f'{file.filename}: {blob.size} bytes, sha256 {blob.checksum}, '
+            f'stored {blob.stored_size} bytes as {blob.encoding or "raw"}'
+        )
+        await self.publish(
+            db=db,
+            user=user,
+            path=path,
+            name=file.filename,
+            blob=blob,
+        )
+        return {
+            'Ready': f'Successfully uploaded {file.filename}',
+            'Size': f'{"{:.3f}".format(blob.size/1024)}kb',
+        }
+
+    @staticmethod
+    async def reserve_written(
+            reserve: Optional[Reserve],
+            blobs: list[TempBlob],
     ) -> None:
-        file.file.seek(0)
-        content = file.file.read()
-        user_path = app_settings.file_folder + f'/{user.name}'
-        p = Path(f'{user_path}/{path}' if path else user_path)
+        """Пересчитывает резерв квоты по фактически принятым байтам."""
+        if reserve is None:
+            return
         try:
-            if not Path.exists(p):
-                Path(p).mkdir(parents=True, exist_ok=True)
-                logger.info(f'mkdir {user_path}')
-            async with aiofiles.open(Path(p, file.filename), 'wb') as f:
-                logger.debug(f)
-                await f.write(content)
-        except Exception as ex:
-            logger.error(ex)
+            await reserve(sum(blob.size for blob in blobs))
+        except HTTPException:
+            for blob in blobs:
+                await remove_silently(blob.path)
+            raise
+
+    async def save_file(
+            self,
+            user: UsersTable,
+            path: str,
+            file: UploadFile,
+    ) -> dict:
+        """Пишет один файл пачки во временный файл, не прерывая остальные."""
+        try:
+            blob = await self.write_file(file=file)
+        except HTTPException as error:
+            return {'name': file.filename, 'error': error.detail}
+        return {
+            'name': file.filename,
+            'size': blob.size,
+            'hash': blob.checksum,
+            'blob': blob,
+        }
+
+    @staticmethod
+    def batch_rows(
+            user: UsersTable,
+            path: str,
+            saved: list[dict],
+            existing: dict[str, ModelType],
+            stored: dict[str, tuple[Optional[str], int]],
+    ) -> tuple[list[dict], list[dict]]:
+        """Строки для вставки новых и обновления существующих файлов."""
+        created, updated = [], []
+        for item in saved:
+            blob = item['blob']
+            encoding, stored_size = stored[blob.checksum]
+            file = existing.get(item['name'])
+            if file is None:
+                created.append({
+                    'name': item['name'],
+                    'path': path,
+                    'size': blob.size,
+                    'stored_size': stored_size,
+                    'encoding': encoding,
+                    'hash': blob.checksum,
+                    'is_downloadable': True,
+                    'author': user.id,
+                    'created_at': datetime.utcnow(),
+                })
+            else:
+                updated.append({
+                    'file_id': file.id,
+                    'file_size': blob.size,
+                    'file_stored_size': stored_size,
+                    'file_encoding': encoding,
+                    'file_hash': blob.checksum,
+                })
+        return created, updated
+
+    @staticmethod
+    def batch_changes(
+            saved: list[dict],
+            existing: dict[str, ModelType],
+    ) -> tuple[Counter, int, int]:
+        """Освобождаемые блобы, число новых файлов и прирост размера."""
+        released: Counter = Counter()
+        added = grown = 0
+        for item in saved:
+            blob = item['blob']
+            file = existing.get(item['name'])
+            if file is None:
+                added += 1
+                grown += blob.size
+                continue
+            grown += blob.size - (file.size or 0)
+            if file.hash is not None:
+                released[file.hash] += 1
+        return released, added, grown
+
+    @staticmethod
+    async def discard(
+            db: AsyncSession,
+            blobs: list[TempBlob],
+            error: Exception,
+    ) -> None:
+        """Откатывает транзакцию и удаляет оставшиеся временные файлы."""
+        logger.error(error)
+        await db.rollback()
+        for blob in blobs:
+            await remove_silently(blob.path)
+
+    async def create_many_in_db(
+            self,
+            db: AsyncSession,
+            user: UsersTable,
+            path: str,
+            saved: list[dict],
+    ) -> dict[str, int]:
+        """Пишет в БД пачку файлов одной транзакцией.
+
+        Возвращает id файлов по их именам.
+        """
+        # Строки блокируются в порядке имен, чтобы параллельные пачки
+        # не взаимоблокировались; освобождаемые хеши и приращения
+        # размеров считаются уже по заблокированным строкам.
+        statement = select(self._model).where(
+            self._model.author == user.id,
+            self._model.path == path,
+            self._model.name.in_([item['name'] for item in saved])
+        ).order_by(self._model.name).with_for_update().execution_options(
+            populate_existing=True)
+        blobs = [item['blob'] for item in saved]
+        try:
+            existing = {
+                file.name: file
+                for file in (await db.scalars(statement)).all()
+            }
+            released, added, grown = self.batch_changes(saved, existing)
+            ids = {name: file.id for name, file in existing.items()}
+            stored = await blobs_crud.acquire_many(db=db, blobs=blobs)
+            created, updated = self.batch_rows(
+                user=user, path=path, saved=saved,
+                existing=existing, stored=stored)
+            if released:
+                await blobs_crud.release_many(db=db, blobs=released)
+            await folders_crud.apply(
+                db=db, author=user.id, changes={path: (added, grown)})
+            if updated:
+                await db.execute(
+                    update(self._model).where(
+                        self._model.id == bindparam('file_id')
+                    ).values(
+                        size=bindparam('file_size'),
+                        stored_size=bindparam('file_stored_size'),
+                        encoding=bindparam('file_encoding'),
+                        hash=bindparam('file_hash'),
+                        is_downloadable=True,
+                        created_at=datetime.utcnow(),
+                    ),
+                    updated
+                )
+            for start in range(0, len(created), BULK_CHUNK):
+                result = await db.execute(
+                    insert(self._model)
+                    .values(created[start:start + BULK_CHUNK])
+                    .returning(self._model.id, self._model.name)
+                )
+                ids.update({row.name: row.id for row in result})
+            await db.commit()
+        except exc.SQLAlchemyError as error:
+            await self.discard(db, blobs, error)
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        except OSError as error:
+            await self.discard(db, blobs, error)
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail='File not saved'
             )
+        await self.forget_meta(
+            user, [(file_id, path, name) for name, file_id in ids.items()])
+        await bump_files_version(user.id)
+        await quotas.adjust(user.id, grown)
+        return ids
 
-    async def create(
+    async def create_many(
             self,
             db: AsyncSession,
             user: UsersTable,
             path: str,
-            file: UploadFile = File(),
-    ) -> dict:
-        file_size = len(await file.read())
-        result = await self.write_file(
-            user=user,
-            path=path,
-            file=file,
-        )
-        logger.info(str(result))
-        if not isinstance(result, Exception):
-            await self.create_in_db(
+            files: list[UploadFile],
+            reserve: Optional[Reserve] = None,
+    ) -> list[dict]:
+        path = normalize_path(path)
+        # Из одноименных файлов пачки сохраняется последний.
+        unique = {file.filename: file for file in files}
+        semaphore = asyncio.Semaphore(app_settings.batch_upload_concurrency)
+
+        async def save(file: UploadFile) -> dict:
+            async with semaphore:
+                return await self.save_file(user=user, path=path, file=file)
+
+        results = await asyncio.gather(*map(save, unique.values()))
+        saved = [item for item in results if 'error' not in item]
+        await self.reserve_written(reserve, [item['blob'] for item in saved])
+        if saved:
+            ids = await self.create_many_in_db(
+                db=db, user=user, path=path, saved=saved)
+            for item in saved:
+                item['id'] = ids.get(item['name'])
+        logger.info(f'Batch upload: {len(saved)} of {len(files)} saved')
+        return results
+
+    async def delete(
+            self,
+            db: AsyncSession,
+            user: UsersTable,
+            identifier: Union[str, int],
+    ) -> None:
+        db_obj = await self.get_by_identifier(
+            db=db, user=user, identifier=identifier, for_update=True)
+        if db_obj is None:
+            raise HTTPException(
+                status_code=404, detail="Item not found"
+            )
+        try:
+            await db.delete(db_obj)
+            if db_obj.hash is not None:
+                await blobs_crud.release(db=db, checksum=db_obj.hash)
+            await folders_crud.apply(
                 db=db,
-                user=user,
-                path=path,
-                file=file,
-                size=file_size,
+                author=user.id,
+                changes={db_obj.path or '': (-1, -(db_obj.size or 0))}
             )
-            return {
-                'Ready': f'Successfully uploaded {file.filename}',
-                'Size': f'{"{:.3f}".format(file_size/1024)}kb',
-            }
-        return {'Error': str(result)}
+            await db.commit()
+        except exc.SQLAlchemyError as error:
+            logger.error(error)
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        await self.forget_meta(
+            user, [(db_obj.id, db_obj.path, db_obj.name)])
+        await bump_files_version(user.id)
+        await quotas.adjust(user.id, -(db_obj.size or 0))
+        if db_obj.hash is None:
+            await remove_silently(self.legacy_path(user, db_obj))
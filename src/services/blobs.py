@@ -0,0 +1,269 @@
+import asyncio
+from collections import Counter
+from pathlib import Path
+from typing import Generic, NamedTuple, Optional, Type, TypeVar
+
+from sqlalchemy import bindparam, exc, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import app_settings
+from core.logger import logger
+from db.db import Base, async_session
+from models.files import BlobModel
+
+from .storage import storage
+from .utils import remove_silently
+
+ModelType = TypeVar("ModelType", bound=Base)
+
+BULK_CHUNK = 1000
+
+StoredAs = tuple[Optional[str], int]
+
+
+class TempBlob(NamedTuple):
+    """Загруженный во временный файл blob."""
+    path: Path
+    size: int
+    checksum: str
+    encoding: Optional[str]
+    stored_size: int
+
+
+def blob_key(checksum: str) -> str:
+    """Ключ blob в хранилище, разбитом по префиксу хеша."""
+    return f'{checksum[:2]}/{checksum[2:4]}/{checksum}'
+
+
+class RepositoryDBBlob(Generic[ModelType]):
+    def __init__(self, model: Type[ModelType]) -> None:
+        self._model = model
+
+    async def acquire(
+        self,
+        db: AsyncSession,
+        blob: TempBlob
+    ) -> StoredAs:
+        """Добавляет ссылку на blob и кладет его в хранилище.
+
+        Возвращает кодек и размер blob в хранилище: если он уже был,
+        это его собственные, а не только что загруженного файла.
+        """
+        stored = await self.acquire_many(db=db, blobs=[blob])
+        return stored[blob.checksum]
+
+    async def acquire_many(
+        self,
+        db: AsyncSession,
+        blobs: list[TempBlob]
+    ) -> dict[str, StoredAs]:
+        """Добавляет ссылки сразу на многие blob и кладет их в хранилище.
+
+        Строки blob блокируются upsert до конца транзакции, поэтому
+        сборщик мусора не удалит объект между проверкой и коммитом.
+        """
+        references = Counter(blob.checksum for blob in blobs)
+        unique: dict[str, TempBlob] = {}
+        for blob in blobs:
+            if blob.checksum in unique:
+                await remove_silently(blob.path)
+            else:
+                unique[blob.checksum] = blob
+        # Порядок по хешу, чтобы параллельные загрузки блокировали
+        # строки в одном порядке.
+        checksums = sorted(unique)
+        stored = {}
+        for start in range(0, len(checksums), BULK_CHUNK):
+            statement = insert(self._model).values([
+                {
+                    'hash': checksum,
+                    'size': unique[checksum].size,
+                    'ref_count': references[checksum],
+                    'encoding': unique[checksum].encoding,
+                    'stored_size': unique[checksum].stored_size,
+                }
+                for checksum in checksums[start:start + BULK_CHUNK]
+            ])
+            statement = statement.on_conflict_do_update(
+                index_elements=[self._model.hash],
+                set_={
+                    'ref_count': (
+                        self._model.ref_count + statement.excluded.ref_count)
+                }
+            ).returning(
+                self._model.hash,
+                self._model.size,
+                self._model.encoding,
+                self._model.stored_size,
+                self._model.ref_count
+            )
+            rows = (await db.execute(statement)).all()
+            written = await asyncio.gather(*(
+                self.put(
+                    unique[row.hash], row.ref_count > references[row.hash])
+                for row in rows
+            ))
+            rewritten = []
+            for row, was_written in zip(rows, written):
+                blob = unique[row.hash]
+                if not was_written:
+                    stored[row.hash] = (row.encoding, row.stored_size)
+                    continue
+                stored[row.hash] = (blob.encoding, blob.stored_size)
+                if (row.size, row.encoding, row.stored_size) != (
+                    blob.size, blob.encoding, blob.stored_size
+                ):
+                    rewritten.append(blob)
+            if rewritten:
+                await db.execute(
+                    update(self._model).where(
+                        self._model.hash == bindparam('blob_hash')
+                    ).values(
+                        size=bindparam('blob_size'),
+                        encoding=bindparam('blob_encoding'),
+                        stored_size=bindparam('blob_stored_size'),
+                    ),
+                    [
+                        {
+                            'blob_hash': blob.checksum,
+                            'blob_size': blob.size,
+                            'blob_encoding': blob.encoding,
+                            'blob_stored_size': blob.stored_size,
+                        }
+                        for blob in rewritten
+                    ]
+                )
+        return stored
+
+    async def release_many(
+        self,
+        db: AsyncSession,
+        blobs: dict[str, int]
+    ) -> None:
+        statement = update(self._model).where(
+            self._model.hash == bindparam('blob_hash')
+        ).values(ref_count=self._model.ref_count - bindparam('count'))
+        await db.execute(
+            statement,
+            [
+                {'blob_hash': checksum, 'count': count}
+                for checksum, count in blobs.items()
+            ]
+        )
+
+    async def release(self, db: AsyncSession, checksum: str) -> None:
+        statement = update(self._model).where(
+            self._model.hash == checksum
+        ).values(ref_count=self._model.ref_count - 1)
+        await db.execute(statement)
+
+    @staticmethod
+    async def put(blob: TempBlob, referenced: bool) -> bool:
+        """Переносит загруженный файл в хранилище, если его там нет.
+
+        Без других ссылок объект перезаписывается: он мог остаться
+        от упавшей загрузки и быть сжат другим кодеком.
+        """
+        key = blob_key(blob.checksum)
+        if referenced and await storage.exists(key):
+            await remove_silently(blob.path)
+            logger.info(f'Blob {blob.checksum} already stored')
+            return False
+        await storage.put(key, blob.path)
+        return True
+
+    async def collect_garbage(self, db: AsyncSession, limit: int) -> int:
+        """Удаляет blob, на которые больше не ссылается ни один файл."""
+        statement = select(self._model.hash).where(
+            self._model.ref_count <= 0
+        ).limit(limit).with_for_update(skip_locked=True)
+        hashes = (await db.scalars(statement)).all()
+        if not hashes:
+            return 0
+        # Объекты удаляются под блокировкой строк: загрузка того же
+        # содержимого дождется коммита и положит объект заново.
+        for checksum in hashes:
+            await storage.delete(blob_key(checksum))
+        await db.execute(
+            self._model.__table__.delete().where(
+                self._model.hash.in_(hashes),
+                self._model.ref_count <= 0
+            )
+        )
+        await db.commit()
+        logger.info(f'Removed {len(hashes)} unreferenced blobs')
+        return len(hashes)
+
+    async def register_orphans(self, db: AsyncSession, limit: int) -> int:
+        """Заводит строки с ref_count=0 для объектов хранилища без строк.
+
+        Такие объекты остаются, если транзакция упала после записи
+        в хранилище. Удаляет их затем обычная сборка мусора.
+        """
+        registered = 0
+        batch: list[str] = []
+        async for key in storage.keys():
+            checksum = key.rpartition('/')[2]
+            if len(checksum) != 64 or key != blob_key(checksum):
+                continue
+            batch.append(checksum)
+            if len(batch) >= limit:
+                registered += await self._register(db, batch)
+                batch = []
+        if batch:
+            registered += await self._register(db, batch)
+        if registered:
+            logger.info(f'Found {registered} blobs without metadata')
+        return registered
+
+    async def _register(self, db: AsyncSession, hashes: list[str]) -> int:
+        # Незакоммиченная строка идущей загрузки заставит вставку
+        # дождаться ее исхода.
+        result = await db.execute(
+            insert(self._model).values([
+                {'hash': checksum, 'size': 0, 'ref_count': 0}
+                for checksum in hashes
+            ]).on_conflict_do_nothing(
+                index_elements=[self._model.hash]
+            ).returning(self._model.hash)
+        )
+        registered = len(result.all())
+        await db.commit()
+        return registered
+
+
+blobs_crud = RepositoryDBBlob(BlobModel)
+_collector: Optional[asyncio.Task] = None
+
+
+async def collect_garbage_periodically() -> None:
+    while True:
+        await asyncio.sleep(app_settings.blob_gc_interval)
+        try:
+            async with async_session() as db:
+                await blobs_crud.register_orphans(
+                    db, app_settings.blob_gc_batch)
+                while await blobs_crud.collect_garbage(
+                    db, app_settings.blob_gc_batch
+                ) == app_settings.blob_gc_batch:
+                    pass
+        except (exc.SQLAlchemyError, OSError) as error:
+            logger.error(f'Blob garbage collector: {error}')
+
+
+def start_garbage_collector() -> None:
+    global _collector
+    if _collector is None:
+        _collector = asyncio.create_task(collect_garbage_periodically())
+
+
+async def stop_garbage_collector() -> None:
+    global _collector
+    if _collector is not None:
+        _collector.cancel()
+        try:
+            await _collector
+        except asyncio.CancelledError:
+            pass
+        _collector = None
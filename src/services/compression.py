@@ -0,0 +1,122 @@
+import zlib
+from contextlib import aclosing
+from mimetypes import guess_type
+from pathlib import PurePosixPath
+from typing import AsyncIterator, Callable, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from core.compression import GZIP, GZIP_WBITS, ZSTD, zstandard
+from core.config import app_settings
+
+
+def storage_encoding() -> Optional[str]:
+    """Кодек хранения из настроек, без zstandard - gzip."""
+    mode = app_settings.storage_compression
+    if mode == ZSTD and zstandard is not None:
+        return ZSTD
+    if mode in (ZSTD, GZIP):
+        return GZIP
+    return None
+
+
+def compressor(encoding: str):
+    level = app_settings.storage_compression_level
+    if encoding == ZSTD:
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    return zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+
+
+def decompressor(encoding: str):
+    if encoding == ZSTD:
+        return zstandard.ZstdDecompressor().decompressobj()
+    return zlib.decompressobj(GZIP_WBITS)
+
+
+def is_compressible(filename: str) -> bool:
+    """Отсекает заведомо сжатые форматы по расширению и типу."""
+    if PurePosixPath(filename).suffix.lower() in (
+        app_settings.zip_stored_extensions
+    ):
+        return False
+    media_type = guess_type(filename)[0] or ''
+    return media_type.partition('/')[0] not in (
+        app_settings.compression_skip_types)
+
+
+def choose_encoding(filename: str, sample: bytes) -> Optional[str]:
+    """Решает, сжимать ли файл, по типу и по сжатию его начала."""
+    encoding = storage_encoding()
+    if (
+        encoding is None
+        or len(sample) < app_settings.compression_min_size
+        or not is_compressible(filename)
+    ):
+        return None
+    sample = sample[:app_settings.compression_sample_size]
+    packer = compressor(encoding)
+    packed = len(packer.compress(sample)) + len(packer.flush())
+    if packed > len(sample) * app_settings.compression_max_ratio:
+        return None
+    return encoding
+
+
+class Encoder:
+    """Сжимает поток загрузки, если первый кусок того стоит."""
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self.encoding: Optional[str] = None
+        self.stored_size = 0
+        self._packer = None
+        self._started = False
+
+    async def encode(self, chunk: bytes) -> bytes:
+        if not self._started:
+            self._started = True
+            self.encoding = await run_in_threadpool(
+                choose_encoding, self.filename, chunk)
+            if self.encoding is not None:
+                self._packer = compressor(self.encoding)
+        if self._packer is not None:
+            chunk = await run_in_threadpool(self._packer.compress, chunk)
+        self.stored_size += len(chunk)
+        return chunk
+
+    def flush(self) -> bytes:
+        tail = self._packer.flush() if self._packer is not None else b''
+        self.stored_size += len(tail)
+        return tail
+
+
+async def decode(
+    stream: AsyncIterator[bytes],
+    encoding: str
+) -> AsyncIterator[bytes]:
+    unpacker = decompressor(encoding)
+    async for chunk in stream:
+        if data := await run_in_threadpool(unpacker.decompress, chunk):
+            yield data
+    if data := unpacker.flush():
+        yield data
+
+
+async def read_decoded(
+    read: Callable[[], AsyncIterator[bytes]],
+    encoding: str,
+    start: int = 0,
+    end: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    """Распаковывает blob на лету и отдает байты с start по end."""
+    position = 0
+    async with aclosing(read()) as stream:
+        async for chunk in decode(stream, encoding):
+            chunk_start, position = position, position + len(chunk)
+            if position <= start:
+                continue
+            yield chunk[
+                max(start - chunk_start, 0):
+                None if end is None else end - chunk_start + 1
+            ]
+            if end is not None and position > end:
+                break
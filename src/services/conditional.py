@@ -0,0 +1,96 @@
+import hashlib
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response, status
+
+from core.config import app_settings
+from db.cache import get_redis
+
+VERSION_PREFIX = 'files:version'
+
+
+def _opaque_tag(etag: str) -> str:
+    etag = etag.strip()
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """Слабое сравнение ETag со списком из If-None-Match."""
+    if header.strip() == '*':
+        return True
+    return _opaque_tag(etag) in {
+        _opaque_tag(tag) for tag in header.split(',')
+    }
+
+
+def is_not_modified(
+    request: Request,
+    etag: str,
+    mtime: Optional[float] = None
+) -> bool:
+    """Проверяет If-None-Match, а без него - If-Modified-Since."""
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get('if-modified-since')
+    if not if_modified_since or mtime is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+    return int(mtime) <= int(since)
+
+
+def not_modified_response(headers: dict) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+
+def _version_key(user_id: int) -> str:
+    return f'{VERSION_PREFIX}:{user_id}'
+
+
+async def files_version(user_id: int) -> str:
+    """Счетчик изменений файлов пользователя.
+
+    Потерянный ключ заводится заново от текущего времени, чтобы старые
+    ETag не совпали с новыми значениями.
+    """
+    async with get_redis().pipeline(transaction=False) as pipe:
+        pipe.set(_version_key(user_id), time.time_ns(), nx=True)
+        pipe.get(_version_key(user_id))
+        _, version = await pipe.execute()
+    return version.decode()
+
+
+async def bump_files_version(user_id: int) -> None:
+    async with get_redis().pipeline(transaction=False) as pipe:
+        pipe.set(_version_key(user_id), time.time_ns(), nx=True)
+        pipe.incr(_version_key(user_id))
+        await pipe.execute()
+
+
+async def listing_etag(request: Request, user_id: int) -> str:
+    query = hashlib.md5(
+        f'{request.url.path}?{request.url.query}'.encode()
+    ).hexdigest()
+    version = await files_version(user_id)
+    return f'W/"{user_id}-{version}-{query[:16]}"'
+
+
+async def check_listing(
+    request: Request,
+    response: Response,
+    user_id: int
+) -> Optional[Response]:
+    """Ставит валидаторы листинга, возвращает 304 до запроса в БД."""
+    headers = {
+        'etag': await listing_etag(request, user_id),
+        'cache-control': app_settings.list_cache_control,
+    }
+    if is_not_modified(request, headers['etag']):
+        return not_modified_response(headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,121 @@
+from typing import Generic, Optional, Type, TypeVar
+
+from sqlalchemy import delete, or_, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.db import Base
+from models.files import FolderModel
+from models.users import UsersTable
+from schemas.files import FolderNode, FolderTree
+
+ModelType = TypeVar("ModelType", bound=Base)
+
+
+def folder_depth(path: str) -> int:
+    return path.count('/') + 1 if path else 0
+
+
+def ancestors(path: str) -> list[str]:
+    """Сама папка и все ее предки, начиная с корня ''."""
+    parts = path.split('/') if path else []
+    return ['/'.join(parts[:depth]) for depth in range(len(parts) + 1)]
+
+
+class RepositoryDBFolder(Generic[ModelType]):
+    def __init__(self, model: Type[ModelType]) -> None:
+        self._model = model
+
+    async def apply(
+        self,
+        db: AsyncSession,
+        author: int,
+        changes: dict[str, tuple[int, int]]
+    ) -> None:
+        """Переносит изменения файлов в агрегаты папки и ее предков.
+
+        changes: папка -> (изменение числа файлов, изменение объема).
+        Вызывается в транзакции, меняющей сами файлы.
+        """
+        totals: dict[str, tuple[int, int]] = {}
+        for path, (count, size) in changes.items():
+            for folder in ancestors(path):
+                total_count, total_size = totals.get(folder, (0, 0))
+                totals[folder] = (total_count + count, total_size + size)
+        # Строки упорядочены по пути, чтобы параллельные транзакции
+        # блокировали их в одном порядке.
+        rows = [
+            {
+                'author': author,
+                'path': folder,
+                'parent': folder.rpartition('/')[0] if folder else None,
+                'depth': folder_depth(folder),
+                'file_count': count,
+                'size': size,
+            }
+            for folder, (count, size) in sorted(totals.items())
+            if count or size
+        ]
+        if not rows:
+            return
+        statement = insert(self._model).values(rows)
+        await db.execute(statement.on_conflict_do_update(
+            index_elements=[self._model.author, self._model.path],
+            set_={
+                'file_count': (
+                    self._model.file_count + statement.excluded.file_count),
+                'size': self._model.size + statement.excluded.size,
+            }
+        ))
+        emptied = [row['path'] for row in rows if row['file_count'] < 0]
+        if emptied:
+            await db.execute(delete(self._model).where(
+                self._model.author == author,
+                self._model.path.in_(emptied),
+                self._model.file_count <= 0
+            ))
+
+    async def tree(
+        self,
+        db: AsyncSession,
+        user: UsersTable,
+        path: str,
+        depth: int
+    ) -> Optional[FolderTree]:
+        """Папка и ее подпапки на depth уровней вниз одним запросом."""
+        base = folder_depth(path)
+        statement = select(self._model).where(
+            self._model.author == user.id,
+            self._model.depth.in_(range(base, base + depth + 1))
+        ).order_by(self._model.depth, self._model.path)
+        if path:
+            statement = statement.where(or_(
+                self._model.path == path,
+                self._model.path.startswith(f'{path}/', autoescape=True)
+            ))
+        folders = (await db.scalars(statement)).all()
+        if not folders or folders[0].path != path:
+            if path:
+                return None
+            return FolderTree(path='', name='', file_count=0, size=0)
+        root, *rest = folders
+        tree = FolderTree(
+            path=root.path,
+            name=root.path.rpartition('/')[2],
+            file_count=root.file_count,
+            size=root.size,
+        )
+        nodes: dict[str, FolderNode] = {root.path: tree}
+        for folder in rest:
+            node = FolderNode(
+                path=folder.path,
+                name=folder.path.rpartition('/')[2],
+                file_count=folder.file_count,
+                size=folder.size,
+            )
+            nodes[folder.path] = node
+            nodes[folder.parent].children.append(node)
+        return tree
+
+
+folders_crud = RepositoryDBFolder(FolderModel)
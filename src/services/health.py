@@ -0,0 +1,117 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import text
+
+from core.config import app_settings
+from core.logger import logger
+from db.cache import get_redis
+from db.db import engine
+
+from .storage import storage
+
+
+def percentile(values: list[float], rank: float) -> float:
+    """Перцентиль по методу ближайшего ранга."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(rank * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Probe:
+    """Проверка одной зависимости со скользящим окном задержек."""
+
+    def __init__(
+        self,
+        name: str,
+        check: Callable[[], Awaitable],
+        timeout: float,
+        window: int,
+    ) -> None:
+        self.name = name
+        self._check = check
+        self.timeout = timeout
+        self._latencies: deque[float] = deque(maxlen=window)
+
+    async def run(self) -> dict:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._check(), self.timeout)
+            status = 'ok'
+        except asyncio.TimeoutError:
+            status = 'timeout'
+        except Exception as error:
+            logger.error(f'Probe {self.name}: {error}')
+            status = 'error'
+        latency = time.perf_counter() - start
+        self._latencies.append(latency)
+        latencies = list(self._latencies)
+        return {
+            'status': status,
+            'latency': latency,
+            'p50': percentile(latencies, 0.5),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+        }
+
+
+class HealthCheck:
+    """Параллельный опрос зависимостей с коротким кэшем результата.
+
+    Одновременные запросы ждут один и тот же опрос, поэтому поток
+    проверок от балансировщика не множит нагрузку на бэкенды.
+    """
+
+    def __init__(self, probes: list[Probe], ttl: float) -> None:
+        self.probes = probes
+        self.ttl = ttl
+        self._result: Optional[dict] = None
+        self._checked_at = 0.0
+        self._running: Optional[asyncio.Task] = None
+
+    async def _run(self) -> dict:
+        results = await asyncio.gather(*(probe.run() for probe in self.probes))
+        self._result = {
+            probe.name: result for probe, result in zip(self.probes, results)
+        }
+        self._checked_at = time.monotonic()
+        return self._result
+
+    async def check(self) -> dict:
+        if (
+            self._result is not None
+            and time.monotonic() - self._checked_at < self.ttl
+        ):
+            return self._result
+        if self._running is None or self._running.done():
+            self._running = asyncio.create_task(self._run())
+        return await asyncio.shield(self._running)
+
+
+async def probe_database() -> None:
+    async with engine.connect() as connection:
+        await connection.execute(text('SELECT 1'))
+
+
+async def probe_redis() -> None:
+    await get_redis().ping()
+
+
+health_check = HealthCheck(
+    probes=[
+        Probe(
+            'database', probe_database,
+            app_settings.ping_timeout, app_settings.ping_window),
+        Probe(
+            'redis', probe_redis,
+            app_settings.ping_timeout, app_settings.ping_window),
+        Probe(
+            'storage', storage.probe,
+            app_settings.ping_timeout, app_settings.ping_window),
+    ],
+    ttl=app_settings.ping_cache_ttl,
+)
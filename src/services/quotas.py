@@ -0,0 +1,263 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import AsyncIterator, Awaitable, Callable, Optional
+from uuid import uuid4
+
+from fastapi import HTTPException, status
+from redis.exceptions import RedisError
+from sqlalchemy import and_, exc, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import app_settings
+from core.logger import logger
+from db.cache import get_redis
+from db.db import async_session
+from models.files import FolderModel
+from models.users import UsersTable
+
+# KEYS[1] - хеш used/limit, KEYS[2] - резервы: член "<id>:<байты>",
+# score - время истечения. ARGV: байты, сейчас, истечение, id.
+# Резерв с тем же id заменяется, если новый размер проходит по квоте.
+RESERVE_SCRIPT = """
+local limit = redis.call('HGET', KEYS[1], 'limit')
+if not limit then
+    return -2
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[2])
+local total = tonumber(redis.call('HGET', KEYS[1], 'used'))
+    + tonumber(ARGV[1])
+local replaced = {}
+for _, member in ipairs(redis.call('ZRANGE', KEYS[2], 0, -1)) do
+    local id, bytes = string.match(member, '^(.*):(%d+)$')
+    if id == ARGV[4] then
+        table.insert(replaced, member)
+    elseif bytes then
+        total = total + tonumber(bytes)
+    end
+end
+if tonumber(limit) > 0 and total > tonumber(limit) then
+    return -1
+end
+for _, member in ipairs(replaced) do
+    redis.call('ZREM', KEYS[2], member)
+end
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[4] .. ':' .. ARGV[1])
+return total
+"""
+# Снимает все резервы, id которых начинается с ARGV[1].
+RELEASE_SCRIPT = """
+local removed = 0
+for _, member in ipairs(redis.call('ZRANGE', KEYS[1], 0, -1)) do
+    if string.sub(member, 1, #ARGV[1]) == ARGV[1] then
+        removed = removed + redis.call('ZREM', KEYS[1], member)
+    end
+end
+return removed
+"""
+# Счетчик без загруженного из БД значения не трогаем: его заполнит
+# следующий резерв или сверка.
+ADJUST_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('HINCRBY', KEYS[1], 'used', ARGV[1])
+end
+return nil
+"""
+
+
+class QuotaCounters:
+    """Квоты пользователей: занятое место и резервы загрузок в Redis.
+
+    Источник правды - агрегаты корневой папки в Postgres, счетчики
+    заполняются из них при первом обращении и периодической сверке.
+    """
+
+    prefix = 'quota'
+
+    def _usage_key(self, user_id: int) -> str:
+        return f'{self.prefix}:{user_id}:usage'
+
+    def _reserved_key(self, user_id: int) -> str:
+        return f'{self.prefix}:{user_id}:reserved'
+
+    @staticmethod
+    def usage_statement(user_ids: list[int]):
+        return select(
+            UsersTable.id, UsersTable.quota, FolderModel.size
+        ).outerjoin(FolderModel, and_(
+            FolderModel.author == UsersTable.id,
+            FolderModel.path == ''
+        )).where(UsersTable.id.in_(user_ids))
+
+    @staticmethod
+    def limit(quota: Optional[int]) -> int:
+        return app_settings.default_quota if quota is None else quota
+
+    async def load(self, db: AsyncSession, user_id: int) -> None:
+        """Заполняет счетчики пользователя из БД, если их еще нет."""
+        row = (await db.execute(self.usage_statement([user_id]))).first()
+        if row is None:
+            return
+        key = self._usage_key(user_id)
+        async with get_redis().pipeline(transaction=True) as pipe:
+            pipe.hsetnx(key, 'used', row.size or 0)
+            pipe.hsetnx(key, 'limit', self.limit(row.quota))
+            await pipe.execute()
+
+    async def reserve(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        size: int,
+        reservation: str,
+        ttl: int
+    ) -> None:
+        """Атомарно проверяет квоту и резервирует место под загрузку.
+
+        Повторный вызов с тем же reservation меняет размер резерва.
+        """
+        script = get_redis().register_script(RESERVE_SCRIPT)
+        keys = [self._usage_key(user_id), self._reserved_key(user_id)]
+        now = time.time()
+        args = [size, now, now + ttl, reservation]
+        total = await script(keys=keys, args=args)
+        if total == -2:
+            await self.load(db, user_id)
+            total = await script(keys=keys, args=args)
+        if total == -1:
+            raise HTTPException(
+                status_code=status.HTTP_507_INSUFFICIENT_STORAGE,
+                detail='Quota exceeded'
+            )
+
+    async def release(self, user_id: int, reservation: str) -> None:
+        script = get_redis().register_script(RELEASE_SCRIPT)
+        await script(keys=[self._reserved_key(user_id)], args=[reservation])
+
+    @asynccontextmanager
+    async def reserved(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        size: int
+    ) -> AsyncIterator[Callable[[int], Awaitable[None]]]:
+        """Резерв на время одного запроса, снимается при любом исходе.
+
+        Отдает функцию, пересчитывающую резерв по фактическому размеру:
+        Content-Length может не быть или он может врать.
+        """
+        reservation = uuid4().hex
+        resize = partial(
+            self.reserve,
+            db,
+            user_id,
+            reservation=reservation,
+            ttl=app_settings.quota_reserve_ttl
+        )
+        await resize(size)
+        try:
+            yield resize
+        finally:
+            await self.release(user_id, reservation)
+
+    async def adjust(self, user_id: int, delta: int) -> None:
+        """Учитывает закоммиченное в БД изменение занятого места."""
+        if not delta:
+            return
+        script = get_redis().register_script(ADJUST_SCRIPT)
+        try:
+            await script(keys=[self._usage_key(user_id)], args=[delta])
+        except RedisError as error:
+            # Расхождение исправит сверка с БД.
+            logger.error(f'Quota adjust for {user_id}: {error}')
+
+    async def usage(self, db: AsyncSession, user_id: int) -> dict:
+        cache = get_redis()
+        key = self._usage_key(user_id)
+        if not await cache.exists(key):
+            await self.load(db, user_id)
+        await cache.zremrangebyscore(
+            self._reserved_key(user_id), '-inf', time.time())
+        counters = await cache.hgetall(key)
+        members = await cache.zrange(self._reserved_key(user_id), 0, -1)
+        limit = int(counters.get(b'limit', 0))
+        return {
+            'used': int(counters.get(b'used', 0)),
+            'reserved': sum(
+                int(member.rpartition(b':')[2]) for member in members),
+            'quota': limit or None,
+        }
+
+    async def reconcile(self, db: AsyncSession) -> int:
+        """Сверяет загруженные в Redis счетчики с БД."""
+        cache = get_redis()
+        batch: list[int] = []
+        reconciled = 0
+        async for key in cache.scan_iter(
+            match=f'{self.prefix}:*:usage',
+            count=app_settings.quota_reconcile_batch
+        ):
+            batch.append(int(key.split(b':')[1]))
+            if len(batch) >= app_settings.quota_reconcile_batch:
+                reconciled += await self._reconcile_batch(db, batch)
+                batch = []
+        if batch:
+            reconciled += await self._reconcile_batch(db, batch)
+        return reconciled
+
+    async def _reconcile_batch(
+        self,
+        db: AsyncSession,
+        user_ids: list[int]
+    ) -> int:
+        rows = {
+            row.id: row
+            for row in await db.execute(self.usage_statement(user_ids))
+        }
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                row = rows.get(user_id)
+                if row is None:
+                    pipe.delete(
+                        self._usage_key(user_id),
+                        self._reserved_key(user_id))
+                    continue
+                pipe.hset(self._usage_key(user_id), mapping={
+                    'used': row.size or 0,
+                    'limit': self.limit(row.quota),
+                })
+            await pipe.execute()
+        return len(user_ids)
+
+
+quotas = QuotaCounters()
+_reconciler: Optional[asyncio.Task] = None
+
+
+async def reconcile_quotas_periodically() -> None:
+    while True:
+        await asyncio.sleep(app_settings.quota_reconcile_interval)
+        try:
+            async with async_session() as db:
+                reconciled = await quotas.reconcile(db)
+            logger.info(f'Reconciled quota counters of {reconciled} users')
+        except (exc.SQLAlchemyError, RedisError) as error:
+            logger.error(f'Quota reconciler: {error}')
+
+
+def start_quota_reconciler() -> None:
+    global _reconciler
+    if _reconciler is None:
+        _reconciler = asyncio.create_task(reconcile_quotas_periodically())
+
+
+async def stop_quota_reconciler() -> None:
+    global _reconciler
+    if _reconciler is not None:
+        _reconciler.cancel()
+        try:
+            await _reconciler
+        except asyncio.CancelledError:
+            pass
+        _reconciler = None
@@ -0,0 +1,324 @@
+import hashlib
+import os
+import stat
+from datetime import timezone
+from email.utils import formatdate, parsedate_to_datetime
+from functools import partial
+from mimetypes import guess_type
+from pathlib import Path
+from typing import AsyncIterator, Callable, Optional, Union
+from urllib.parse import quote
+from uuid import uuid4
+
+import aiofiles.os
+from fastapi import HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
+
+from core.compression import accepts_encoding
+from core.config import app_settings
+from schemas.files import FileMeta
+
+from .blobs import blob_key
+from .compression import read_decoded
+from .conditional import is_not_modified, not_modified_response
+from .storage import read_local, storage
+
+MAX_RANGES = 32
+
+ByteRange = tuple[int, int]
+Reader = Callable[[int, Optional[int]], AsyncIterator[bytes]]
+
+
+def file_etag(stat_result: os.stat_result) -> str:
+    etag_base = f'{stat_result.st_mtime}-{stat_result.st_size}'
+    return f'"{hashlib.md5(etag_base.encode()).hexdigest()}"'
+
+
+def parse_range_spec(spec: str, size: int) -> Optional[ByteRange]:
+    """Разбирает один диапазон, None - если он невыполним."""
+    start_str, sep, end_str = spec.strip().partition('-')
+    if not sep:
+        raise ValueError(spec)
+    if not start_str:
+        suffix = int(end_str)
+        if suffix <= 0 or size == 0:
+            return None
+        return max(size - suffix, 0), size - 1
+    start = int(start_str)
+    end = int(end_str) if end_str else size - 1
+    if start < 0 or (end_str and start > end):
+        raise ValueError(spec)
+    if start >= size:
+        return None
+    return start, min(end, size - 1)
+
+
+def parse_range(header: str, size: int) -> Optional[list[ByteRange]]:
+    """Разбирает заголовок Range в список включительных диапазонов.
+
+    None означает, что заголовок нужно проигнорировать и отдать файл
+    целиком, пустой список - что ни один диапазон не выполним (416).
+    """
+    unit, _, ranges_spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not ranges_spec:
+        return None
+    try:
+        ranges = [
+            byte_range for byte_range in (
+                parse_range_spec(spec, size)
+                for spec in ranges_spec.split(',')
+            ) if byte_range is not None
+        ]
+    except ValueError:
+        return None
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+
+def if_range_matches(request: Request, etag: str, mtime: float) -> bool:
+    if_range = request.headers.get('if-range')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    if if_range.startswith('W/'):
+        return False
+    try:
+        since = parsedate_to_datetime(if_range).timestamp()
+    except (TypeError, ValueError):
+        return False
+    return int(mtime) == int(since)
+
+
+def multipart_header(
+    boundary: str,
+    media_type: str,
+    byte_range: ByteRange,
+    size: int
+) -> bytes:
+    start, end = byte_range
+    return (
+        f'--{boundary}\r\n'
+        f'Content-Type: {media_type}\r\n'
+        f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+    ).encode()
+
+
+async def read_ranges(
+    read: Reader,
+    ranges: list[ByteRange],
+    boundary: str,
+    media_type: str,
+    size: int
+) -> AsyncIterator[bytes]:
+    for byte_range in ranges:
+        yield multipart_header(boundary, media_type, byte_range, size)
+        async for chunk in read(*byte_range):
+            yield chunk
+        yield b'\r\n'
+    yield f'--{boundary}--\r\n'.encode()
+
+
+def range_response(
+    read: Reader,
+    ranges: list[ByteRange],
+    size: int,
+    media_type: str,
+    headers: dict
+) -> Response:
+    if not ranges:
+        headers['content-range'] = f'bytes */{size}'
+        return Response(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers=headers
+        )
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers['content-range'] = f'bytes {start}-{end}/{size}'
+        headers['content-length'] = str(end - start + 1)
+        return StreamingResponse(
+            read(start, end),
+            status_code=status.HTTP_206_PARTIAL_CONTENT,
+            media_type=media_type,
+            headers=headers
+        )
+    boundary = uuid4().hex
+    headers['content-length'] = str(
+        sum(
+            len(multipart_header(boundary, media_type, byte_range, size))
+            + byte_range[1] - byte_range[0] + 1 + 2
+            for byte_range in ranges
+        ) + len(f'--{boundary}--\r\n')
+    )
+    return StreamingResponse(
+        read_ranges(read, ranges, boundary, media_type, size),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type=f'multipart/byteranges; boundary={boundary}',
+        headers=headers
+    )
+
+
+def content_disposition(filename: str) -> str:
+    return f"attachment; filename*=utf-8''{quote(filename)}"
+
+
+def validators(etag: str, mtime: float) -> dict:
+    return {
+        'etag': etag,
+        'last-modified': formatdate(mtime, usegmt=True),
+        'cache-control': app_settings.download_cache_control,
+    }
+
+
+def stream_response(
+    request: Request,
+    read: Reader,
+    size: int,
+    mtime: float,
+    etag: str,
+    filename: str,
+    extra_headers: Optional[dict] = None,
+) -> Response:
+    """Отдает данные целиком или запрошенные в Range диапазоны."""
+    headers = {**validators(etag, mtime), **(extra_headers or {})}
+    if is_not_modified(request, etag, mtime):
+        return not_modified_response(headers)
+    media_type = guess_type(filename)[0] or 'application/octet-stream'
+    headers.update({
+        'accept-ranges': 'bytes',
+        'content-disposition': content_disposition(filename),
+    })
+    range_header = request.headers.get('range')
+    if range_header and if_range_matches(request, etag, mtime):
+        ranges = parse_range(range_header, size)
+        if ranges is not None:
+            return range_response(read, ranges, size, media_type, headers)
+    headers['content-length'] = str(size)
+    return StreamingResponse(
+        read(0, None),
+        media_type=media_type,
+        headers=headers
+    )
+
+
+def accel_redirect_response(
+    request: Request,
+    path: Path,
+    filename: str,
+    etag: str,
+    mtime: float
+) -> Response:
+    """Передает отдачу файла nginx через X-Accel-Redirect.
+
+    Тип и валидаторы ставятся здесь: nginx видит только файл на диске,
+    а у blob в имени нет расширения.
+    """
+    relative = os.path.normpath(
+        os.path.relpath(path, app_settings.file_folder))
+    if relative.startswith('..') or os.path.isabs(relative):
+        raise HTTPException(
+            status_code=404, detail="Item not found"
+        )
+    headers = validators(etag, mtime)
+    if is_not_modified(request, etag, mtime):
+        return not_modified_response(headers)
+    location = app_settings.x_accel_location.rstrip('/')
+    headers.update({
+        'x-accel-redirect': f'{location}/{quote(relative)}',
+        'content-disposition': content_disposition(filename),
+    })
+    return Response(
+        media_type=guess_type(filename)[0] or 'application/octet-stream',
+        headers=headers
+    )
+
+
+async def file_response(
+    request: Request,
+    path: Union[str, Path],
+) -> Response:
+    """Отдает файл с локального диска."""
+    path = Path(path)
+    try:
+        stat_result = await aiofiles.os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=404, detail="Item not found"
+        )
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise HTTPException(
+            status_code=404, detail="Item not found"
+        )
+    if app_settings.x_accel_redirect:
+        return accel_redirect_response(
+            request,
+            path,
+            path.name,
+            file_etag(stat_result),
+            stat_result.st_mtime
+        )
+    return stream_response(
+        request=request,
+        read=partial(read_local, path),
+        size=stat_result.st_size,
+        mtime=stat_result.st_mtime,
+        etag=file_etag(stat_result),
+        filename=path.name,
+    )
+
+
+def encoded_blob_response(
+    request: Request,
+    file: FileMeta,
+    mtime: float
+) -> Response:
+    """Отдает сжатый blob как есть или распаковывает его на лету.
+
+    Сжатое и исходное представления различаются ETag, а диапазоны
+    считаются по байтам того представления, которое отдается.
+    """
+    key = blob_key(file.hash)
+    extra_headers = {'vary': 'accept-encoding'}
+    if accepts_encoding(
+        request.headers.get('accept-encoding', ''), file.encoding
+    ):
+        extra_headers['content-encoding'] = file.encoding
+        return stream_response(
+            request=request,
+            read=partial(storage.read, key),
+            size=file.stored_size,
+            mtime=mtime,
+            etag=f'"{file.hash}-{file.encoding}"',
+            filename=file.name,
+            extra_headers=extra_headers,
+        )
+    return stream_response(
+        request=request,
+        read=partial(read_decoded, partial(storage.read, key), file.encoding),
+        size=file.size,
+        mtime=mtime,
+        etag=f'"{file.hash}"',
+        filename=file.name,
+        extra_headers=extra_headers,
+    )
+
+
+def blob_response(request: Request, file: FileMeta) -> Response:
+    """Отдает файл из хранилища blob по его хешу."""
+    key = blob_key(file.hash)
+    path = storage.local_path(key)
+    etag = f'"{file.hash}"'
+    mtime = file.created_at.replace(tzinfo=timezone.utc).timestamp()
+    if file.encoding is not None:
+        return encoded_blob_response(request, file, mtime)
+    if app_settings.x_accel_redirect and path is not None:
+        return accel_redirect_response(request, path, file.name, etag, mtime)
+    return stream_response(
+        request=request,
+        read=partial(storage.read, key),
+        size=file.size,
+        mtime=mtime,
+        etag=etag,
+        filename=file.name,
+    )
@@ -0,0 +1,427 @@
+import hashlib
+import hmac
+import os
+import shutil
+from abc import ABC, abstractmethod
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator, Optional
+from urllib.parse import quote
+from uuid import uuid4
+from xml.etree import ElementTree
+
+import aiofiles
+import aiofiles.os
+import httpx
+from fastapi.concurrency import run_in_threadpool
+
+from core.config import app_settings
+from core.logger import logger
+
+from .utils import remove_silently
+
+PROBE_KEY = '.probe'
+
+
+class StorageError(OSError):
+    pass
+
+
+async def read_local(
+    path: Path,
+    start: int = 0,
+    end: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    """Читает файл с диска кусками, end включительно."""
+    async with aiofiles.open(path, 'rb') as file:
+        await file.seek(start)
+        remaining = None if end is None else end - start + 1
+        while remaining is None or remaining > 0:
+            size = app_settings.download_chunk_size
+            if remaining is not None:
+                size = min(size, remaining)
+            chunk = await file.read(size)
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
+def probe_folder(path: Path) -> None:
+    """Пишет, сбрасывает на диск и читает обратно пробный файл."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = uuid4().bytes
+    try:
+        with open(path, 'wb') as file:
+            file.write(payload)
+            file.flush()
+            os.fsync(file.fileno())
+        with open(path, 'rb') as file:
+            if file.read() != payload:
+                raise StorageError(f'Probe file {path} is corrupted')
+    finally:
+        path.unlink(missing_ok=True)
+
+
+class StorageBackend(ABC):
+    """Хранилище blob по ключу."""
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        pass
+
+    @abstractmethod
+    async def put(self, key: str, source: Path) -> None:
+        """Сохраняет локальный файл под ключом, файл удаляется."""
+
+    @abstractmethod
+    def read(
+        self,
+        key: str,
+        start: int = 0,
+        end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        pass
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        pass
+
+    @abstractmethod
+    def keys(self, prefix: str = '') -> AsyncIterator[str]:
+        """Перебирает ключи объектов, начинающиеся с prefix."""
+
+    async def delete_prefix(self, prefix: str) -> None:
+        """Удаляет все объекты с ключами, начинающимися с prefix."""
+        keys = [key async for key in self.keys(prefix)]
+        for key in keys:
+            await self.delete(key)
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """Путь на диске, если хранилище локальное."""
+        return None
+
+    async def probe(self) -> None:
+        """Проверяет, что хранилище отвечает."""
+        await self.exists(PROBE_KEY)
+
+
+class LocalStorage(StorageBackend):
+    def __init__(self, folder: str) -> None:
+        self._folder = folder
+
+    def local_path(self, key: str) -> Path:
+        return Path(self._folder, key)
+
+    async def exists(self, key: str) -> bool:
+        return await aiofiles.os.path.exists(self.local_path(key))
+
+    async def put(self, key: str, source: Path) -> None:
+        path = self.local_path(key)
+        await aiofiles.os.makedirs(path.parent, exist_ok=True)
+        await aiofiles.os.replace(source, path)
+
+    def read(
+        self,
+        key: str,
+        start: int = 0,
+        end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        return read_local(self.local_path(key), start, end)
+
+    async def delete(self, key: str) -> None:
+        await remove_silently(self.local_path(key))
+
+    async def keys(self, prefix: str = '') -> AsyncIterator[str]:
+        # Префикс здесь - путь к папке внутри хранилища.
+        walk = await run_in_threadpool(
+            lambda: list(os.walk(self.local_path(prefix))))
+        for folder, _, names in walk:
+            relative = os.path.relpath(folder, self._folder)
+            for name in names:
+                yield Path(relative, name).as_posix()
+
+    async def delete_prefix(self, prefix: str) -> None:
+        await run_in_threadpool(
+            shutil.rmtree, self.local_path(prefix), True)
+
+    async def probe(self) -> None:
+        await run_in_threadpool(
+            probe_folder, Path(self._folder, f'.probe-{uuid4().hex}'))
+
+
+def _hmac(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode(), hashlib.sha256).digest()
+
+
+class S3Storage(StorageBackend):
+    """S3-совместимое хранилище (AWS, MinIO, moto) поверх httpx.
+
+    Запросы подписываются AWS Signature V4 с UNSIGNED-PAYLOAD, объекты
+    адресуются в path-style: <endpoint>/<bucket>/<key>.
+    """
+
+    def __init__(
+        self,
+        endpoint_url: str,
+        bucket: str,
+        region: str,
+        access_key: str,
+        secret_key: str,
+        part_size: int,
+    ) -> None:
+        self._endpoint = httpx.URL(endpoint_url)
+        self._bucket = bucket
+        self._region = region
+        self._access_key = access_key
+        self._secret_key = secret_key
+        self._part_size = part_size
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def start(self) -> None:
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=app_settings.s3_max_connections,
+                max_keepalive_connections=app_settings.s3_max_connections,
+            ),
+            timeout=app_settings.s3_timeout,
+        )
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            raise RuntimeError('S3 client is not initialized')
+        return self._client
+
+    def _request(
+        self,
+        method: str,
+        key: str,
+        params: Optional[dict] = None,
+        headers: Optional[dict] = None,
+    ) -> tuple[str, dict]:
+        """Собирает URL и подписанные заголовки запроса."""
+        now = datetime.utcnow()
+        amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+        date = now.strftime('%Y%m%d')
+        path = quote(f'{self._endpoint.path.rstrip("/")}/{self._bucket}/{key}')
+        query = '&'.join(
+            f'{quote(name, safe="~")}={quote(str(value), safe="~")}'
+            for name, value in sorted((params or {}).items())
+        )
+        host = self._endpoint.netloc.decode()
+        headers = {
+            **{name.lower(): value for name, value in (headers or {}).items()},
+            'host': host,
+            'x-amz-date': amz_date,
+            'x-amz-content-sha256': 'UNSIGNED-PAYLOAD',
+        }
+        signed_headers = ';'.join(sorted(headers))
+        canonical_request = '\n'.join([
+            method,
+            path,
+            query,
+            ''.join(
+                f'{name}:{str(headers[name]).strip()}\n'
+                for name in sorted(headers)
+            ),
+            signed_headers,
+            'UNSIGNED-PAYLOAD',
+        ])
+        scope = f'{date}/{self._region}/s3/aws4_request'
+        string_to_sign = '\n'.join([
+            'AWS4-HMAC-SHA256',
+            amz_date,
+            scope,
+            hashlib.sha256(canonical_request.encode()).hexdigest(),
+        ])
+        signing_key = _hmac(
+            _hmac(
+                _hmac(
+                    _hmac(f'AWS4{self._secret_key}'.encode(), date),
+                    self._region
+                ),
+                's3'
+            ),
+            'aws4_request'
+        )
+        signature = hmac.new(
+            signing_key, string_to_sign.encode(), hashlib.sha256
+        ).hexdigest()
+        headers['authorization'] = (
+            f'AWS4-HMAC-SHA256 Credential={self._access_key}/{scope}, '
+            f'SignedHeaders={signed_headers}, Signature={signature}'
+        )
+        del headers['host']
+        url = f'{self._endpoint.scheme}://{host}{path}'
+        return (f'{url}?{query}' if query else url), headers
+
+    async def _send(
+        self,
+        method: str,
+        key: str,
+        params: Optional[dict] = None,
+        headers: Optional[dict] = None,
+        content=None,
+    ) -> httpx.Response:
+        url, headers = self._request(method, key, params, headers)
+        try:
+            response = await self.client.request(
+                method, url, headers=headers, content=content)
+        except httpx.HTTPError as error:
+            raise StorageError(f'S3 {method} {key}: {error}')
+        # 404 - штатный ответ только для проверки и удаления ключа;
+        # для остальных запросов это ошибка, например нет bucket.
+        missing = response.status_code == 404 and method in ('HEAD', 'DELETE')
+        if response.status_code >= 300 and not missing:
+            raise StorageError(
+                f'S3 {method} {key}: {response.status_code} {response.text}')
+        return response
+
+    async def exists(self, key: str) -> bool:
+        response = await self._send('HEAD', key)
+        return response.status_code != 404
+
+    async def put(self, key: str, source: Path) -> None:
+        size = (await aiofiles.os.stat(source)).st_size
+        try:
+            if size <= self._part_size:
+                await self._send(
+                    'PUT',
+                    key,
+                    headers={'content-length': str(size)},
+                    content=read_local(source)
+                )
+            else:
+                await self._put_multipart(key, source, size)
+        finally:
+            await remove_silently(source)
+
+    async def _put_multipart(self, key: str, source: Path, size: int) -> None:
+        response = await self._send('POST', key, params={'uploads': ''})
+        upload_id = self._find(response.content, 'UploadId')
+        parts = []
+        try:
+            for number, start in enumerate(
+                range(0, size, self._part_size), start=1
+            ):
+                end = min(start + self._part_size, size) - 1
+                response = await self._send(
+                    'PUT',
+                    key,
+                    params={'partNumber': number, 'uploadId': upload_id},
+                    headers={'content-length': str(end - start + 1)},
+                    content=read_local(source, start, end)
+                )
+                parts.append((number, response.headers['etag']))
+            body = ''.join(
+                f'<Part><PartNumber>{number}</PartNumber>'
+                f'<ETag>{etag}</ETag></Part>'
+                for number, etag in parts
+            )
+            response = await self._send(
+                'POST',
+                key,
+                params={'uploadId': upload_id},
+                content=(
+                    f'<CompleteMultipartUpload>{body}'
+                    f'</CompleteMultipartUpload>'
+                ).encode()
+            )
+            if b'<Error>' in response.content:
+                raise StorageError(f'S3 complete {key}: {response.text}')
+        except Exception:
+            logger.error(f'S3 multipart upload of {key} aborted')
+            await self._send('DELETE', key, params={'uploadId': upload_id})
+            raise
+
+    @staticmethod
+    def _find(content: bytes, tag: str) -> str:
+        for element in ElementTree.fromstring(content).iter():
+            if element.tag.rsplit('}', 1)[-1] == tag:
+                return element.text or ''
+        raise StorageError(f'S3 response has no {tag}')
+
+    async def read(
+        self,
+        key: str,
+        start: int = 0,
+        end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        headers = {}
+        if start or end is not None:
+            headers['range'] = f'bytes={start}-{"" if end is None else end}'
+        url, headers = self._request('GET', key, headers=headers)
+        try:
+            async with self.client.stream(
+                'GET', url, headers=headers
+            ) as response:
+                if response.status_code == 404:
+                    raise FileNotFoundError(key)
+                if response.status_code >= 300:
+                    raise StorageError(
+                        f'S3 GET {key}: {response.status_code}')
+                async for chunk in response.aiter_bytes(
+                    app_settings.download_chunk_size
+                ):
+                    yield chunk
+        except httpx.HTTPError as error:
+            raise StorageError(f'S3 GET {key}: {error}')
+
+    async def delete(self, key: str) -> None:
+        await self._send('DELETE', key)
+
+    async def keys(self, prefix: str = '') -> AsyncIterator[str]:
+        params = {'list-type': 2, 'prefix': prefix}
+        while True:
+            response = await self._send('GET', '', params=params)
+            token = None
+            for element in ElementTree.fromstring(response.content).iter():
+                tag = element.tag.rsplit('}', 1)[-1]
+                if tag == 'Key':
+                    yield element.text or ''
+                elif tag == 'NextContinuationToken':
+                    token = element.text
+            if not token:
+                return
+            params = {
+                'list-type': 2,
+                'prefix': prefix,
+                'continuation-token': token,
+            }
+
+
+def create_storage() -> StorageBackend:
+    if app_settings.storage_backend == 's3':
+        return S3Storage(
+            endpoint_url=app_settings.s3_endpoint_url,
+            bucket=app_settings.s3_bucket,
+            region=app_settings.s3_region,
+            access_key=app_settings.s3_access_key,
+            secret_key=app_settings.s3_secret_key,
+            part_size=app_settings.s3_part_size,
+        )
+    return LocalStorage(folder=app_settings.blob_folder)
+
+
+storage = create_storage()
+
+
+async def init_storage() -> None:
+    await storage.start()
+
+
+async def close_storage() -> None:
+    await storage.close()
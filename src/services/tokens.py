@@ -0,0 +1,129 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+from uuid import uuid4
+
+from core.config import app_settings
+from db.cache import get_redis
+from schemas.users import UserRedis
+
+from .utils import user_obj, user_str
+
+HEADER = base64.urlsafe_b64encode(
+    json.dumps({'alg': 'HS256', 'typ': 'JWT'}).encode()
+).rstrip(b'=').decode()
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _signature(message: str) -> str:
+    return _b64encode(hmac.new(
+        app_settings.secret_key.encode(), message.encode(), hashlib.sha256
+    ).digest())
+
+
+def is_signed_token(token: str) -> bool:
+    return token.count('.') == 2
+
+
+class RevocationList:
+    """Отозванные до истечения подписанные токены: jti -> exp."""
+
+    def __init__(self) -> None:
+        self._entries: dict[str, float] = {}
+
+    def add(self, jti: str, expires: float) -> None:
+        if expires > time.time():
+            self._entries[jti] = expires
+
+    def replace(self, entries: dict[str, float]) -> None:
+        self._entries = entries
+
+    def __contains__(self, jti: str) -> bool:
+        expires = self._entries.get(jti)
+        if expires is None:
+            return False
+        if expires <= time.time():
+            del self._entries[jti]
+            return False
+        return True
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+revocations = RevocationList()
+
+
+def create_signed_token(user) -> tuple[str, datetime]:
+    """Выпускает подписанный токен в формате JWT (HS256)."""
+    expires = datetime.now() + timedelta(
+        minutes=app_settings.access_token_expire_minutes)
+    payload = _b64encode(json.dumps({
+        'user': user_str(user),
+        'exp': expires.timestamp(),
+        'jti': uuid4().hex,
+    }).encode())
+    message = f'{HEADER}.{payload}'
+    return f'{message}.{_signature(message)}', expires
+
+
+def decode_signed_token(token: str) -> Optional[dict]:
+    """Проверяет подпись и срок токена, без отзыва."""
+    header, _, rest = token.partition('.')
+    payload, _, signature = rest.partition('.')
+    if header != HEADER or not hmac.compare_digest(
+        signature, _signature(f'{header}.{payload}')
+    ):
+        return None
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+    if claims.get('exp', 0) <= time.time():
+        return None
+    return claims
+
+
+def user_from_signed_token(token: str) -> Optional[UserRedis]:
+    claims = decode_signed_token(token)
+    if claims is None or claims.get('jti') in revocations:
+        return None
+    return user_obj(claims['user'])
+
+
+def remember_revoked(token: str) -> None:
+    """Заносит токен в локальный список отзыва, если он подписан нами."""
+    claims = decode_signed_token(token) if is_signed_token(token) else None
+    if claims is not None:
+        revocations.add(claims['jti'], claims['exp'])
+
+
+async def revoke_signed_token(token: str) -> None:
+    claims = decode_signed_token(token)
+    if claims is None:
+        return
+    await get_redis().zadd(
+        app_settings.token_revocation_key, {claims['jti']: claims['exp']})
+    revocations.add(claims['jti'], claims['exp'])
+
+
+async def sync_revocations() -> None:
+    """Загружает список отзыва из Redis, заодно чистит истекшие записи."""
+    cache = get_redis()
+    now = time.time()
+    await cache.zremrangebyscore(
+        app_settings.token_revocation_key, '-inf', now)
+    entries = await cache.zrangebyscore(
+        app_settings.token_revocation_key, now, '+inf', withscores=True)
+    revocations.replace({jti.decode(): exp for jti, exp in entries})
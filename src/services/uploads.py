@@ -0,0 +1,342 @@
+import asyncio
+import hashlib
+import os
+import shutil
+from functools import partial
+from pathlib import Path
+from typing import AsyncIterator, Optional
+from uuid import uuid4
+
+import aiofiles
+import aiofiles.os
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import app_settings
+from core.logger import logger
+from db.cache import get_redis
+from models.files import FileModel
+from models.users import UsersTable
+
+from .blobs import TempBlob
+from .files import files_crud
+from .quotas import quotas
+from .storage import storage
+from .utils import normalize_path, remove_silently
+
+
+def copy_file(src, dest) -> None:
+    """Копирует файл средствами ядра, без буферов в userspace."""
+    remaining = os.fstat(src.fileno()).st_size
+    while remaining > 0:
+        copied = os.copy_file_range(src.fileno(), dest.fileno(), remaining)
+        if copied == 0:
+            break
+        remaining -= copied
+
+
+def assemble_parts(parts: list[Path], target: Path) -> tuple[int, str]:
+    """Склеивает части в один файл и возвращает его размер и SHA-256."""
+    with open(target, 'wb') as dest:
+        for part in parts:
+            with open(part, 'rb') as src:
+                if hasattr(os, 'copy_file_range'):
+                    copy_file(src, dest)
+                else:
+                    shutil.copyfileobj(src, dest)
+    checksum = hashlib.sha256()
+    size = 0
+    with open(target, 'rb') as file:
+        while chunk := file.read(app_settings.upload_chunk_size):
+            size += len(chunk)
+            checksum.update(chunk)
+    return size, checksum.hexdigest()
+
+
+async def download_parts(keys: list[str], target: Path) -> tuple[int, str]:
+    """Собирает части из удаленного хранилища в один файл."""
+    checksum = hashlib.sha256()
+    size = 0
+    async with aiofiles.open(target, 'wb') as dest:
+        for key in keys:
+            async for chunk in storage.read(key):
+                size += len(chunk)
+                checksum.update(chunk)
+                await dest.write(chunk)
+    return size, checksum.hexdigest()
+
+
+class RepositoryUploadSession:
+    """Сессии многочастной загрузки: метаданные в Redis, части в хранилище.
+
+    Части лежат в том же хранилище, что и blob, поэтому с S3 сессию
+    можно продолжать и завершать на любой реплике.
+    """
+
+    prefix = 'upload'
+
+    def __init__(self, storage_prefix: str) -> None:
+        self._storage_prefix = storage_prefix
+
+    def _key(self, session_id: str) -> str:
+        return f'{self.prefix}:{session_id}'
+
+    def _parts_key(self, session_id: str) -> str:
+        return f'{self.prefix}:{session_id}:parts'
+
+    def _session_prefix(self, session_id: str) -> str:
+        return f'{self._storage_prefix}/{session_id}/'
+
+    def _part_key(self, session_id: str, number: int) -> str:
+        return f'{self._session_prefix(session_id)}{number}'
+
+    async def _touch(self, session_id: str) -> None:
+        cache = get_redis()
+        await cache.expire(
+            self._key(session_id), app_settings.upload_session_ttl)
+        await cache.expire(
+            self._parts_key(session_id), app_settings.upload_session_ttl)
+
+    async def create(
+        self,
+        db: AsyncSession,
+        user: UsersTable,
+        path: str,
+        name: str,
+        size: Optional[int] = None,
+    ) -> dict:
+        session_id = uuid4().hex
+        if size is not None:
+            await quotas.reserve(
+                db, user.id, size, session_id,
+                app_settings.upload_session_ttl)
+        session = {
+            'id': session_id,
+            'user_id': user.id,
+            'path': normalize_path(path),
+            'name': name,
+            'size': size if size is not None else -1,
+            'part_size': app_settings.upload_part_size,
+        }
+        await get_redis().hset(self._key(session_id), mapping=session)
+        await self._touch(session_id)
+        return await self.get(user=user, session_id=session_id)
+
+    async def get(self, user: UsersTable, session_id: str) -> dict:
+        cache = get_redis()
+        session = {
+            key.decode(): value.decode() for key, value in (
+                await cache.hgetall(self._key(session_id))).items()
+        }
+        if not session or int(session['user_id']) != user.id:
+            raise HTTPException(
+                status_code=404, detail="Upload session not found"
+            )
+        parts = await cache.hgetall(self._parts_key(session_id))
+        size = int(session['size'])
+        return {
+            'id': session_id,
+            'path': session['path'],
+            'name': session['name'],
+            'size': size if size >= 0 else None,
+            'part_size': int(session['part_size']),
+            'parts': sorted(int(number) for number in parts),
+            'received': sum(int(part_size) for part_size in parts.values()),
+        }
+
+    async def write_part(
+        self,
+        db: AsyncSession,
+        user: UsersTable,
+        session_id: str,
+        number: int,
+        stream: AsyncIterator[bytes],
+        length: int,
+    ) -> int:
+        session = await self.get(user=user, session_id=session_id)
+        reserve = None
+        limit = app_settings.upload_part_size
+        if session['size'] is not None:
+            # Объявленный размер уже зарезервирован целиком, поэтому
+            # части вместе не должны его превышать.
+            previous = await get_redis().hget(
+                self._parts_key(session_id), number)
+            limit = min(limit, session['size'] - (
+                session['received'] - int(previous or 0)))
+            if length > limit:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail='Upload exceeds declared size'
+                )
+        else:
+            # Без объявленного размера место резервируется по частям:
+            # сначала по Content-Length, затем по принятым байтам.
+            reserve = partial(
+                quotas.reserve,
+                db,
+                user.id,
+                reservation=f'{session_id}.{number}',
+                ttl=app_settings.upload_session_ttl
+            )
+            await reserve(length)
+        tmp_path = Path(
+            app_settings.blob_folder, 'tmp',
+            f'.{session_id}.{number}.{uuid4().hex}.part')
+        size = 0
+        try:
+            await aiofiles.os.makedirs(tmp_path.parent, exist_ok=True)
+            async with aiofiles.open(tmp_path, 'wb') as f:
+                async for chunk in stream:
+                    size += len(chunk)
+                    if size > limit:
+                        raise HTTPException(
+                            status_code=(
+                                status.HTTP_413_REQUEST_ENTITY_TOO_LARGE),
+                            detail=(
+                                'Part too large'
+                                if size > app_settings.upload_part_size
+                                else 'Upload exceeds declared size')
+                        )
+                    await f.write(chunk)
+            if reserve is not None:
+                await reserve(size)
+            await storage.put(self._part_key(session_id, number), tmp_path)
+        except HTTPException:
+            await remove_silently(tmp_path)
+            raise
+        except OSError as error:
+            logger.error(error)
+            await remove_silently(tmp_path)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail='Part not saved'
+            )
+        await get_redis().hset(self._parts_key(session_id), number, size)
+        await self._touch(session_id)
+        return size
+
+    async def complete(
+        self,
+        db: AsyncSession,
+        user: UsersTable,
+        session_id: str,
+    ) -> FileModel:
+        session = await self.get(user=user, session_id=session_id)
+        parts = session['parts']
+        if not parts or parts != list(range(1, len(parts) + 1)):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail='Missing parts'
+            )
+        if session['size'] is not None and (
+            session['received'] != session['size']
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail='Size mismatch'
+            )
+        lock = f'{self._key(session_id)}:lock'
+        if not await get_redis().set(
+            lock, 1, nx=True, ex=app_settings.upload_session_ttl
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail='Upload is already being completed'
+            )
+        keys = [self._part_key(session_id, number) for number in parts]
+        paths = [storage.local_path(key) for key in keys]
+        tmp_path = Path(app_settings.blob_folder, 'tmp', f'.{session_id}.part')
+        try:
+            await aiofiles.os.makedirs(tmp_path.parent, exist_ok=True)
+            if None in paths:
+                size, checksum = await download_parts(keys, tmp_path)
+            else:
+                size, checksum = await run_in_threadpool(
+                    assemble_parts, paths, tmp_path)
+        except OSError as error:
+            logger.error(error)
+            await remove_silently(tmp_path)
+            await get_redis().delete(lock)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail='File not saved'
+            )
+        try:
+            file = await files_crud.publish(
+                db=db,
+                user=user,
+                path=session['path'],
+                name=session['name'],
+                blob=TempBlob(
+                    path=tmp_path,
+                    size=size,
+                    checksum=checksum,
+                    encoding=None,
+                    stored_size=size,
+                ),
+            )
+        except HTTPException:
+            await get_redis().delete(lock)
+            raise
+        await self.abort(user=user, session_id=session_id)
+        return file
+
+    async def abort(self, user: UsersTable, session_id: str) -> None:
+        await self.get(user=user, session_id=session_id)
+        await self._drop(session_id)
+        await quotas.release(user.id, session_id)
+
+    async def _drop(self, session_id: str) -> None:
+        await get_redis().delete(
+            self._key(session_id),
+            self._parts_key(session_id),
+            f'{self._key(session_id)}:lock',
+        )
+        await storage.delete_prefix(self._session_prefix(session_id))
+
+    async def collect_stale(self) -> int:
+        """Удаляет из хранилища части сессий, истекших в Redis."""
+        session_ids = {
+            key.split('/')[1]
+            async for key in storage.keys(f'{self._storage_prefix}/')
+        }
+        removed = 0
+        for session_id in session_ids:
+            if not await get_redis().exists(self._key(session_id)):
+                await self._drop(session_id)
+                removed += 1
+        if removed:
+            logger.info(f'Removed {removed} stale upload sessions')
+        return removed
+
+
+upload_sessions = RepositoryUploadSession(
+    storage_prefix=app_settings.upload_session_prefix)
+_sweeper: Optional[asyncio.Task] = None
+
+
+async def sweep_sessions_periodically() -> None:
+    while True:
+        await asyncio.sleep(app_settings.upload_session_sweep_interval)
+        try:
+            await upload_sessions.collect_stale()
+        except Exception as error:
+            logger.error(f'Upload session sweeper: {error}')
+
+
+def start_session_sweeper() -> None:
+    global _sweeper
+    if _sweeper is None:
+        _sweeper = asyncio.create_task(sweep_sessions_periodically())
+
+
+async def stop_session_sweeper() -> None:
+    global _sweeper
+    if _sweeper is not None:
+        _sweeper.cancel()
+        try:
+            await _sweeper
+        except asyncio.CancelledError:
+            pass
+        _sweeper = None
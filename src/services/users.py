@@ -1,7 +1,13 @@
+import asyncio
+from typing import Optional
+
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import exc
 
-from db.db import get_session
+from core.config import app_settings
+from core.logger import logger
+from db.db import async_session, get_session
 from models.users import TokensTable, UsersTable
 from schemas.users import UserCreate
 
@@ -15,6 +21,7 @@ class RepositoryUser(RepositoryDBUser[UsersTable, UserCreate]):
 user_crud = RepositoryUser(UsersTable)
 token_crud = RepositoryDBToken(TokensTable)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="v1/auth")
+_sweeper: Optional[asyncio.Task] = None
 
 
 async def get_current_user(
@@ -33,3 +40,38 @@ async def get_current_user(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Inactive user"
         )
     return user
+
+
+async def sweep_tokens_periodically() -> None:
+    while True:
+        await asyncio.sleep(app_settings.token_sweep_interval)
+        try:
+            removed = 0
+            async with async_session() as db:
+                while True:
+                    count = await token_crud.delete_expired(
+                        db, app_settings.token_sweep_batch)
+                    removed += count
+                    if count < app_settings.token_sweep_batch:
+                        break
+            if removed:
+                logger.info(f'Removed {removed} expired tokens')
+        except exc.SQLAlchemyError as error:
+            logger.error(f'Token sweeper: {error}')
+
+
+def start_token_sweeper() -> None:
+    global _sweeper
+    if _sweeper is None:
+        _sweeper = asyncio.create_task(sweep_tokens_periodically())
+
+
+async def stop_token_sweeper() -> None:
+    global _sweeper
+    if _sweeper is not None:
+        _sweeper.cancel()
+        try:
+            await _sweeper
+        except asyncio.CancelledError:
+            pass
+        _sweeper = None
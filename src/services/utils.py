@@ -1,32 +1,114 @@
+import asyncio
 import hashlib
+import hmac
 import random
 import string
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor
+)
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import aiofiles.os
+from fastapi import Request
 
 from core.config import app_settings
 from schemas.users import UserRedis
 
+_hash_executor: Optional[Executor] = None
+_hash_semaphore: Optional[asyncio.Semaphore] = None
+
 
 def get_random_string(length=12):
     """Генерирует случайную строку."""
     return "".join(random.choice(string.ascii_letters) for _ in range(length))
 
 
-def hash_password(password: str, salt: str = None):
-    """Хеширует пароль."""
-    if salt is None:
-        salt = get_random_string()
-    enc = hashlib.pbkdf2_hmac(
+def _pbkdf2(password: str, salt: str, iterations: int) -> str:
+    return hashlib.pbkdf2_hmac(
         app_settings.algorithm,
         password.encode(),
         salt.encode(),
-        app_settings.hmac_iteration)
-    return f"{salt}${enc.hex()}"
+        iterations).hex()
+
+
+def _split_hash(hashed_password: str) -> tuple[int, str, str]:
+    """Разбирает хеш на число итераций, соль и сам хеш."""
+    parts = hashed_password.split("$")
+    if len(parts) == 2:
+        return app_settings.legacy_hmac_iteration, parts[0], parts[1]
+    _, iterations, salt, enc = parts
+    return int(iterations), salt, enc
+
+
+def hash_password(password: str, salt: str = None, iterations: int = None):
+    """Хеширует пароль."""
+    if salt is None:
+        salt = get_random_string()
+    if iterations is None:
+        iterations = app_settings.hmac_iteration
+    enc = _pbkdf2(password, salt, iterations)
+    return f"pbkdf2_{app_settings.algorithm}${iterations}${salt}${enc}"
 
 
 def validate_password(password: str, hashed_password: str):
     """Проверяет, что хеш пароля совпадает с хешем из БД."""
-    salt = hashed_password.split("$")[0]
-    return hash_password(password, salt) == hashed_password
+    iterations, salt, enc = _split_hash(hashed_password)
+    return hmac.compare_digest(_pbkdf2(password, salt, iterations), enc)
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """Проверяет, что хеш посчитан с устаревшим числом итераций."""
+    iterations, _, _ = _split_hash(hashed_password)
+    return iterations < app_settings.hmac_iteration
+
+
+def get_hash_executor() -> Executor:
+    global _hash_executor
+    if _hash_executor is None:
+        if app_settings.password_hash_executor == 'process':
+            _hash_executor = ProcessPoolExecutor(
+                max_workers=app_settings.password_hash_workers)
+        else:
+            _hash_executor = ThreadPoolExecutor(
+                max_workers=app_settings.password_hash_workers,
+                thread_name_prefix='password-hash')
+    return _hash_executor
+
+
+def shutdown_hash_executor() -> None:
+    global _hash_executor, _hash_semaphore
+    if _hash_executor is not None:
+        _hash_executor.shutdown(wait=False, cancel_futures=True)
+        _hash_executor = None
+    # Семафор привязан к event loop, новый запуск создаст свой.
+    _hash_semaphore = None
+
+
+async def _run_in_hash_executor(func: Callable, *args: Any) -> Any:
+    global _hash_semaphore
+    if _hash_semaphore is None:
+        _hash_semaphore = asyncio.Semaphore(
+            app_settings.password_hash_concurrency)
+    async with _hash_semaphore:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_hash_executor(), func, *args)
+
+
+async def hash_password_async(password: str) -> str:
+    """Хеширует пароль в пуле, не блокируя event loop."""
+    return await _run_in_hash_executor(hash_password, password)
+
+
+async def validate_password_async(
+    password: str,
+    hashed_password: str
+) -> bool:
+    """Проверяет пароль в пуле, не блокируя event loop."""
+    return await _run_in_hash_executor(
+        validate_password, password, hashed_password)
 
 
 def user_str(user):
@@ -43,3 +125,25 @@ def user_obj(user: dict) -> UserRedis:
         id=user.get('id'),
         is_active=True if user.get('is_active') else False
     )
+
+
+def normalize_path(path: Optional[str]) -> str:
+    """Приводит путь папки к виду без ведущего и конечного слеша."""
+    path = (path or '').strip('/')
+    return '' if path == '.' else path
+
+
+def content_length(request: Request) -> int:
+    """Размер тела запроса из заголовка, 0 - если он неизвестен."""
+    try:
+        return max(int(request.headers.get('content-length', 0)), 0)
+    except ValueError:
+        return 0
+
+
+async def remove_silently(path: Path) -> None:
+    """Удаляет файл, если он существует."""
+    try:
+        await aiofiles.os.remove(path)
+    except FileNotFoundError:
+        pass
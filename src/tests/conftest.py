@@ -23,11 +23,13 @@ def event_loop(request) -> Generator:
 
 @pytest_asyncio.fixture(scope='function')
 async def client() -> AsyncGenerator:
+    await app.router.startup()
     async with AsyncClient(
         app=app,
         base_url=BASE_URL
     ) as client:
         yield client
+    await app.router.shutdown()
 
 
 @pytest_asyncio.fixture(scope="module")
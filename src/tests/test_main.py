@@ -1,9 +1,35 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+from types import SimpleNamespace
+from typing import AsyncIterator
+from uuid import uuid4
+from zipfile import ZipFile
+
+import pytest
+import zstandard
 from fastapi import status
 from httpx import AsyncClient
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import exc, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 
 from .mocks import CustomTestUser
-from core.config import BASE_DIR
+from core import logger as logger_module
+from core.config import BASE_DIR, app_settings
+from db.db import TimedQueuePool, database_dsn, pool_stats
+from models.files import BlobModel, FileModel
+from models.users import UsersTable
+from services import storage as storage_module
+from services.blobs import blob_key, blobs_crud
+from services.quotas import quotas
+from services.storage import S3Storage, StorageError, storage
+from services.users import token_crud
+from services.utils import hash_password, needs_rehash, validate_password
 
 
 test_user = CustomTestUser()
@@ -42,6 +68,36 @@ async def test_get_token(
     test_user.set_token(response.json().get('access_token'))
 
 
+async def test_legacy_password_rehash(
+    client: AsyncClient, async_session: AsyncSession
+) -> None:
+    legacy = hash_password(
+        test_user.password, 'legacysalt', app_settings.legacy_hmac_iteration
+    ).split('$', 2)[2]
+    assert legacy.count('$') == 1
+    await async_session.execute(
+        update(UsersTable).values(hashed_password=legacy))
+    await async_session.commit()
+    response = await client.post(
+        '/auth', data={
+            'username': test_user.name,
+            'password': test_user.password
+        }
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    hashed = await async_session.scalar(select(UsersTable.hashed_password))
+    assert hashed.startswith(f'pbkdf2_{app_settings.algorithm}$')
+    assert not needs_rehash(hashed)
+    assert validate_password(test_user.password, hashed)
+    response = await client.post(
+        '/auth', data={
+            'username': test_user.name,
+            'password': 'wrong'
+        }
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
 async def test_get_user_info(
     client: AsyncClient, async_session: AsyncSession
 ) -> None:
@@ -54,6 +110,10 @@ async def test_get_user_info(
     assert response.json().get('name') == test_user.name
     assert 'id' in response.json()
     assert response.json().get('id') == 1
+    for token in ('garbage', str(uuid4())):
+        response = await client.get(
+            '/me', headers={'Authorization': f'Bearer {token}'})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
 
 
 async def test_get_availability_services(
@@ -67,6 +127,9 @@ async def test_get_availability_services(
     assert 'datebase' in response.json()
     assert 'redis' in response.json()
     assert 'user' in response.json()
+    probes = response.json().get('probes')
+    assert {'database', 'redis', 'storage'} <= probes.keys()
+    assert all(probe['status'] == 'ok' for probe in probes.values())
 
 
 async def test_upload_file(
@@ -101,3 +164,796 @@ async def test_get_file_list(
     assert len(response.json().get('items')) == 1
     assert 'total' in response.json()
     assert response.json().get('total') == 1
+
+
+async def test_get_file_list_cursor(
+    client: AsyncClient, async_session: AsyncSession
+) -> None:
+    response = await client.get(
+        '/list/cursor',
+        params={'size': 1},
+        headers={'Authorization': f'Bearer {test_user.token}'}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json().get('items')) == 1
+    assert response.json().get('next_page') is None
+
+
+async def test_download_file_range(
+    client: AsyncClient, async_session: AsyncSession
+) -> None:
+    response = await client.get(
+        '/download',
+        params={'identifier': 'test_dir/test_file.txt'},
+        headers={
+            'Authorization': f'Bearer {test_user.token}',
+            'Range': 'bytes=0-3',
+        }
+    )
+    assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+    assert response.headers.get('content-range').startswith('bytes 0-3/')
+    with open(BASE_DIR + '/tests/test_file.txt', 'rb') as file:
+        assert response.content == file.read(4)
+
+
+async def test_download_accel_redirect(
+    client: AsyncClient, async_session: AsyncSession, monkeypatch
+) -> None:
+    headers = {'Authorization': f'Bearer {test_user.token}'}
+    params = {'identifier': 'test_dir/test_file.txt'}
+    response = await client.get('/download', params=params, headers=headers)
+    etag = response.headers.get('etag')
+    monkeypatch.setattr(app_settings, 'x_accel_redirect', True)
+    response = await client.get('/download', params=params, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers.get('x-accel-redirect').startswith(
+        app_settings.x_accel_location.rstrip('/') + '/')
+    assert response.headers.get('content-type').startswith('text/plain')
+    assert response.headers.get('etag') == etag
+    assert 'last-modified' in response.headers
+    response = await client.get(
+        '/download',
+        params=params,
+        headers={**headers, 'If-None-Match': etag}
+    )
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+async def test_conditional_get(
+    client: AsyncClient, async_session: AsyncSession
+) -> None:
+    headers = {'Authorization': f'Bearer {test_user.token}'}
+    params = {'identifier': 'test_dir/test_file.txt'}
+    response = await client.get('/download', params=params, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    etag = response.headers.get('etag')
+    last_modified = response.headers.get('last-modified')
+    response = await client.get(
+        '/download',
+        params=params,
+        headers={**headers, 'If-None-Match': etag}
+    )
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.content == b''
+    response = await client.get(
+        '/download',
+        params=params,
+        headers={**headers, 'If-Modified-Since': last_modified}
+    )
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    response = await client.get('/list', headers=headers)
+    etag = response.headers.get('etag')
+    assert etag.startswith('W/')
+    response = await client.get(
+        '/list', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    with open(BASE_DIR + '/tests/test_file.txt', 'rb') as file:
+        response = await client.post(
+            '/upload',
+            params={'path': 'test_dir'},
+            files={'file': ('test_file.txt', file)},
+            headers=headers
+        )
+    assert response.status_code == status.HTTP_201_CREATED
+    response = await client.get(
+        '/list', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers.get('etag') != etag
+
+
+async def test_delete_file(
+    client: AsyncClient, async_session: AsyncSession
+) -> None:
+    headers = {'Authorization': f'Bearer {test_user.token}'}
+    response = await client.post(
+        '/upload', params={'path': 'to_delete'}, files={
+            'file': (
+                'test_file.txt',
+                open(BASE_DIR + '/tests/test_file.txt', 'rb')
+            )
+        },
+        headers=headers
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    response = await client.get(
+        '/download',
+        params={'identifier': 'to_delete/test_file.txt'},
+        headers=headers
+    )
+    assert response.status_code == status.HTTP_200_OK
+    response = await client.delete(
+        '/delete',
+        params={'identifier': 'to_delete/test_file.txt'},
+        headers=headers
+    )
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    response = await client.get(
+        '/download',
+        params={'identifier': 'to_delete/test_file.txt'},
+        headers=headers
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+async def test_meta_cache_invalidation(
+    client: AsyncClient, async_session: AsyncSession
+) -> None:
+    headers = {'Authorization': f'Bearer {test_user.token}'}
+
+    async def download() -> list[tuple[int, bytes]]:
+        responses = [
+            await client.get(
+                '/download',
+                params={'identifier': identifier},
+                headers=headers
+            )
+            for identifier in ('cache/file.txt', file_id)
+        ]
+        return [
+            (response.status_code, response.content)
+            for response in responses
+        ]
+
+    for content in (b'first', b'second version'):
+        response = await client.post(
+            '/upload',
+            params={'path': 'cache'},
+            files={'file': ('file.txt', content)},
+            headers=headers
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        file_id = await async_session.scalar(
+            select(FileModel.id).where(FileModel.path == 'cache'))
+        assert await download() == [(status.HTTP_200_OK, content)] * 2
+    duplicate = FileModel(name='file.txt', path='cache', author=1)
+    async_session.add(duplicate)
+    with pytest.raises(exc.IntegrityError):
+        await async_session.commit()
+    await async_session.rollback()
+    response = await client.delete(
+        '/delete', params={'identifier': 'cache/file.txt'}, headers=headers)
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert [code for code, _ in await download()] == [
+        status.HTTP_404_NOT_FOUND] * 2
+
+
+async def test_upload_session(
+    client: AsyncClient, async_session: AsyncSession
+) -> None:
+    headers = {'Authorization': f'Bearer {test_user.token}'}
+    response = await client.post(
+        '/uploads',
+        json={'path': 'parts', 'name': 'joined.txt', 'size': 11},
+        headers=headers
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    session_id = response.json().get('id')
+    for number, data in ((2, b'world!'), (1, b'hello')):
+        response = await client.put(
+            f'/uploads/{session_id}/parts/{number}',
+            content=data,
+            headers=headers
+        )
+        assert response.status_code == status.HTTP_200_OK
+
+    async def chunked(body: bytes) -> AsyncIterator[bytes]:
+        yield body
+
+    for content in (b'world!!', chunked(b'world!!'), b'x' * 12):
+        response = await client.put(
+            f'/uploads/{session_id}/parts/2',
+            content=content,
+            headers=headers
+        )
+        assert response.status_code == (
+            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    response = await client.put(
+        f'/uploads/{session_id}/parts/2',
+        content=chunked(b'world!'),
+        headers=headers
+    )
+    assert response.status_code == status.HTTP_200_OK
+    response = await client.get(f'/uploads/{session_id}', headers=headers)
+    assert response.json().get('parts') == [1, 2]
+    assert response.json().get('received') == 11
+    response = await client.post(
+        f'/uploads/{session_id}/complete', headers=headers)
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.json().get('size') == 11
+    response = await client.get(
+        '/download',
+        params={'identifier': 'parts/joined.txt'},
+        headers=headers
+    )
+    assert response.content == b'helloworld!'
+
+
+async def test_upload_batch(
+    client: AsyncClient, async_session: AsyncSession
+) -> None:
+    headers = {'Authorization': f'Bearer {test_user.token}'}
+    for _ in range(2):
+        response = await client.post(
+            '/upload/batch', params={'path': 'batch'}, files=[
+                ('files', ('a.txt', b'same content')),
+                ('files', ('b.txt', b'same content')),
+                ('files', ('c.txt', b'other content')),
+            ],
+            headers=headers
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        assert [item.get('name') for item in response.json()] == [
+            'a.txt', 'b.txt', 'c.txt']
+        assert all(item.get('id') for item in response.json())
+    response = await client.get(
+        '/download',
+        params={'identifier': 'batch/b.txt'},
+        headers=headers
+    )
+    assert response.content == b'same content'
+
+
+async def test_download_folder(
+    client: AsyncClient, async_session: AsyncSession
+) -> None:
+    response = await client.get(
+        '/download',
+        params={'identifier': 'batch', 'download_folder': True},
+        headers={'Authorization': f'Bearer {test_user.token}'}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    archive = ZipFile(BytesIO(response.content))
+    assert archive.namelist() == ['a.txt', 'b.txt', 'c.txt']
+    assert archive.read('c.txt') == b'other content'
+    for path, name, content in (
+        ('nested/a', 'one.txt', b'one'),
+        ('nested/a/b', 'two.txt', b'two'),
+    ):
+        response = await client.post(
+            '/upload',
+            params={'path': path},
+            files={'file': (name, content)},
+            headers={'Authorization': f'Bearer {test_user.token}'}
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+    response = await client.get(
+        '/download',
+        params={'identifier': 'nested/a', 'download_folder': True},
+        headers={'Authorization': f'Bearer {test_user.token}'}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    archive = ZipFile(BytesIO(response.content))
+    assert sorted(archive.namelist()) == ['b/two.txt', 'one.txt']
+    assert archive.read('b/two.txt') == b'two'
+
+
+async def test_upload_size_limit(
+    client: AsyncClient, async_session: AsyncSession, monkeypatch
+) -> None:
+    monkeypatch.setattr(app_settings, 'max_upload_size', 100)
+    monkeypatch.setattr(app_settings, 'upload_chunk_size', 16)
+    headers = {'Authorization': f'Bearer {test_user.token}'}
+    tmp_folder = Path(app_settings.blob_folder, 'tmp')
+    leftovers = set(tmp_folder.glob('*.part'))
+    content = bytes(range(101))
+    response = await client.post(
+        '/upload',
+        params={'path': 'limit'},
+        files={'file': ('big.bin', content)},
+        headers=headers
+    )
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    assert set(tmp_folder.glob('*.part')) == leftovers
+    assert not await storage.exists(
+        blob_key(hashlib.sha256(content).hexdigest()))
+    assert await async_session.scalar(
+        select(FileModel).where(FileModel.path == 'limit')) is None
+    response = await client.post(
+        '/upload',
+        params={'path': 'limit'},
+        files={'file': ('big.bin', content[:100])},
+        headers=headers
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    file = await async_session.scalar(
+        select(FileModel).where(FileModel.path == 'limit'))
+    assert file.hash == hashlib.sha256(content[:100]).hexdigest()
+    assert await storage.exists(blob_key(file.hash))
+
+
+async def test_metrics(
+    client: AsyncClient, async_session: AsyncSession
+) -> None:
+    response = await client.get('http://127.0.0.1/metrics')
+    assert response.status_code == status.HTTP_200_OK
+    assert 'route="/api/v1/download"' in response.text
+    assert 'db_query_duration_seconds_count' in response.text
+    assert 'redis_command_duration_seconds_count' in response.text
+
+
+async def test_pool_stats(async_session: AsyncSession) -> None:
+    stats = pool_stats()
+    assert stats['overflow'] == 0
+    assert stats['checkouts'] > 0
+    pool_engine = create_async_engine(
+        database_dsn,
+        poolclass=TimedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.1,
+    )
+    try:
+        async with pool_engine.connect():
+            with pytest.raises(exc.TimeoutError):
+                await pool_engine.connect()
+        pool = pool_engine.pool
+        assert (pool.checkouts, pool.timeouts) == (1, 1)
+        assert pool.wait_max < 0.1
+    finally:
+        await pool_engine.dispose()
+
+
+async def test_signed_token(
+    client: AsyncClient, async_session: AsyncSession, monkeypatch
+) -> None:
+    monkeypatch.setattr(app_settings, 'token_mode', 'signed')
+    response = await client.post(
+        '/auth', data={
+            'username': test_user.name,
+            'password': test_user.password
+        }
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    token = response.json().get('access_token')
+    assert token.count('.') == 2
+    headers = {'Authorization': f'Bearer {token}'}
+    response = await client.get('/me', headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json().get('name') == test_user.name
+    response = await client.get(
+        '/me', headers={'Authorization': f'Bearer {token[:-2]}xx'})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    response = await client.post('/logout', headers=headers)
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    response = await client.get('/me', headers=headers)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+async def test_folder_tree(
+    client: AsyncClient, async_session: AsyncSession
+) -> None:
+    headers = {'Authorization': f'Bearer {test_user.token}'}
+    for path, name, content in (
+        ('tree/a', 'one.txt', b'one'),
+        ('tree/a/b', 'two.txt', b'two!!'),
+        ('tree', 'three.txt', b'four'),
+    ):
+        response = await client.post(
+            '/upload',
+            params={'path': path},
+            files={'file': (name, content)},
+            headers=headers
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+    response = await client.get(
+        '/tree', params={'path': 'tree'}, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    tree = response.json()
+    assert (tree['file_count'], tree['size']) == (3, 12)
+    assert [file['name'] for file in tree['files']] == ['three.txt']
+    [folder] = tree['children']
+    assert (folder['path'], folder['file_count'], folder['size']) == (
+        'tree/a', 2, 8)
+    assert folder['children'] == []
+    response = await client.delete(
+        '/delete',
+        params={'identifier': 'tree/a/b/two.txt'},
+        headers=headers
+    )
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    response = await client.get(
+        '/tree', params={'path': 'tree', 'depth': 2}, headers=headers)
+    [folder] = response.json()['children']
+    assert (folder['file_count'], folder['size']) == (1, 3)
+    assert folder['children'] == []
+    response = await client.get(
+        '/tree', params={'path': 'tree/a/b'}, headers=headers)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+async def test_concurrent_overwrite(
+    client: AsyncClient, async_session: AsyncSession
+) -> None:
+    headers = {'Authorization': f'Bearer {test_user.token}'}
+
+    async def upload(content: bytes) -> int:
+        response = await client.post(
+            '/upload',
+            params={'path': 'race'},
+            files={'file': ('same.txt', content)},
+            headers=headers
+        )
+        return response.status_code
+
+    contents = [f'version {number}'.encode() for number in range(6)]
+    assert await upload(contents[0]) == status.HTTP_201_CREATED
+    codes = await asyncio.gather(*map(upload, contents[1:]))
+    assert set(codes) == {status.HTTP_201_CREATED}
+    file = await async_session.scalar(
+        select(FileModel).where(FileModel.path == 'race'))
+    counts = dict((await async_session.execute(
+        select(BlobModel.hash, BlobModel.ref_count).where(
+            BlobModel.hash.in_(
+                [hashlib.sha256(content).hexdigest()
+                 for content in contents]))
+    )).all())
+    assert counts.pop(file.hash) == 1
+    assert set(counts.values()) == {0}
+
+
+async def test_concurrent_batch_overwrite(
+    client: AsyncClient, async_session: AsyncSession
+) -> None:
+    headers = {'Authorization': f'Bearer {test_user.token}'}
+
+    async def upload(number: int) -> int:
+        response = await client.post(
+            '/upload/batch', params={'path': 'race/batch'}, files=[
+                ('files', (name, f'{name} {number}'.encode()))
+                for name in ('x.txt', 'y.txt')
+            ],
+            headers=headers
+        )
+        return response.status_code
+
+    assert await upload(0) == status.HTTP_201_CREATED
+    codes = await asyncio.gather(*map(upload, range(1, 5)))
+    assert set(codes) == {status.HTTP_201_CREATED}
+    files = (await async_session.scalars(
+        select(FileModel).where(FileModel.path == 'race/batch'))).all()
+    counts = dict((await async_session.execute(
+        select(BlobModel.hash, BlobModel.ref_count).where(
+            BlobModel.hash.in_(
+                [hashlib.sha256(f'{name} {number}'.encode()).hexdigest()
+                 for name in ('x.txt', 'y.txt') for number in range(5)]))
+    )).all())
+    assert [counts.pop(file.hash) for file in files] == [1, 1]
+    assert set(counts.values()) == {0}
+
+
+async def test_concurrent_overwrite_folders(
+    client: AsyncClient, async_session: AsyncSession
+) -> None:
+    headers = {'Authorization': f'Bearer {test_user.token}'}
+
+    async def upload(size: int) -> int:
+        response = await client.post(
+            '/upload',
+            params={'path': 'race/sizes'},
+            files={'file': ('grow.txt', b'x' * size)},
+            headers=headers
+        )
+        return response.status_code
+
+    assert await upload(1) == status.HTTP_201_CREATED
+    codes = await asyncio.gather(*map(upload, range(2, 8)))
+    assert set(codes) == {status.HTTP_201_CREATED}
+    files = (await async_session.scalars(
+        select(FileModel).where(FileModel.path.like('race%')))).all()
+    response = await client.get(
+        '/tree', params={'path': 'race'}, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    tree = response.json()
+    assert (tree['file_count'], tree['size']) == (
+        len(files), sum(file.size for file in files))
+    folders = {folder['path']: folder for folder in tree['children']}
+    [grow] = [file for file in files if file.path == 'race/sizes']
+    assert (
+        folders['race/sizes']['file_count'], folders['race/sizes']['size']
+    ) == (1, grow.size)
+
+
+async def test_compressed_storage(
+    client: AsyncClient, async_session: AsyncSession, monkeypatch
+) -> None:
+    monkeypatch.setattr(app_settings, 'storage_compression', 'gzip')
+    headers = {'Authorization': f'Bearer {test_user.token}'}
+    content = b'line of text\n' * 1000
+    response = await client.post(
+        '/upload',
+        params={'path': 'compressed'},
+        files={'file': ('log.txt', content)},
+        headers=headers
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    response = await client.get(
+        '/download',
+        params={'identifier': 'compressed/log.txt'},
+        headers={**headers, 'Accept-Encoding': 'gzip'}
+    )
+    assert response.headers['content-encoding'] == 'gzip'
+    assert int(response.headers['content-length']) < len(content)
+    assert response.content == content
+    response = await client.get(
+        '/download',
+        params={'identifier': 'compressed/log.txt'},
+        headers={
+            **headers,
+            'Accept-Encoding': 'identity',
+            'Range': 'bytes=13-24',
+        }
+    )
+    assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+    assert 'content-encoding' not in response.headers
+    assert response.content == content[13:25]
+
+
+async def test_compressed_response(
+    client: AsyncClient, async_session: AsyncSession, monkeypatch
+) -> None:
+    monkeypatch.setattr(app_settings, 'response_compression_min_size', 0)
+    headers = {'Authorization': f'Bearer {test_user.token}'}
+    response = await client.get(
+        '/list', headers={**headers, 'Accept-Encoding': 'gzip;q=0.5, zstd'})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers['content-encoding'] == 'zstd'
+    assert 'Accept-Encoding' in response.headers['vary']
+    body = zstandard.ZstdDecompressor().decompressobj().decompress(
+        response.content)
+    assert json.loads(body)['total'] >= 1
+    response = await client.get(
+        '/list', headers={**headers, 'Accept-Encoding': 'identity'})
+    assert 'content-encoding' not in response.headers
+    assert response.json()['total'] >= 1
+
+
+async def test_quota(
+    client: AsyncClient, async_session: AsyncSession
+) -> None:
+    headers = {'Authorization': f'Bearer {test_user.token}'}
+    await quotas.reconcile(async_session)
+    response = await client.get('/usage', headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    used = response.json()['used']
+    response = await client.get('/tree', headers=headers)
+    assert used == response.json()['size'] > 0
+    await async_session.execute(
+        update(UsersTable).values(quota=used + 1000))
+    await async_session.commit()
+    await quotas.reconcile(async_session)
+    response = await client.post(
+        '/upload',
+        params={'path': 'quota'},
+        files={'file': ('big.bin', b'x' * 5000)},
+        headers=headers
+    )
+    assert response.status_code == status.HTTP_507_INSUFFICIENT_STORAGE
+
+    async def chunked(body: bytes) -> AsyncIterator[bytes]:
+        yield body
+
+    boundary = uuid4().hex
+    body = (
+        f'--{boundary}\r\n'
+        'Content-Disposition: form-data; name="file"; filename="big.bin"\r\n'
+        '\r\n'
+    ).encode() + b'x' * 5000 + f'\r\n--{boundary}--\r\n'.encode()
+    response = await client.post(
+        '/upload',
+        params={'path': 'quota'},
+        content=chunked(body),
+        headers={
+            **headers,
+            'Content-Type': f'multipart/form-data; boundary={boundary}',
+        }
+    )
+    assert response.status_code == status.HTTP_507_INSUFFICIENT_STORAGE
+    response = await client.post(
+        '/uploads',
+        json={'path': 'quota', 'name': 'big.bin'},
+        headers=headers
+    )
+    session_id = response.json().get('id')
+    response = await client.put(
+        f'/uploads/{session_id}/parts/1',
+        content=chunked(b'x' * 5000),
+        headers=headers
+    )
+    assert response.status_code == status.HTTP_507_INSUFFICIENT_STORAGE
+    await client.delete(f'/uploads/{session_id}', headers=headers)
+    response = await client.post(
+        '/uploads',
+        json={'path': 'quota', 'name': 'big.bin', 'size': -1},
+        headers=headers
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    response = await client.post(
+        '/upload',
+        params={'path': 'quota'},
+        files={'file': ('small.bin', b'x' * 10)},
+        headers=headers
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    response = await client.get('/usage', headers=headers)
+    assert response.json() == {
+        'used': used + 10, 'reserved': 0, 'quota': used + 1000}
+    response = await client.delete(
+        '/delete', params={'identifier': 'quota/small.bin'}, headers=headers)
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    response = await client.get('/usage', headers=headers)
+    assert response.json()['used'] == used
+    await async_session.execute(update(UsersTable).values(quota=None))
+    await async_session.commit()
+    await quotas.reconcile(async_session)
+
+
+async def test_blob_garbage_collection(
+    client: AsyncClient, async_session: AsyncSession, tmp_path
+) -> None:
+    orphan = hashlib.sha256(b'orphan').hexdigest()
+    source = tmp_path / 'orphan'
+    source.write_bytes(b'orphan')
+    await storage.put(blob_key(orphan), source)
+    assert await blobs_crud.register_orphans(async_session, 1000) == 1
+    await blobs_crud.collect_garbage(async_session, 1000)
+    assert not await storage.exists(blob_key(orphan))
+    headers = {'Authorization': f'Bearer {test_user.token}'}
+    response = await client.get(
+        '/download',
+        params={'identifier': 'test_dir/test_file.txt'},
+        headers=headers
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+
+def test_log_sampling(monkeypatch) -> None:
+    now = [100.0]
+    monkeypatch.setattr(
+        logger_module, 'time', SimpleNamespace(monotonic=lambda: now[0]))
+    sampling = logger_module.SamplingFilter(rate=2)
+
+    def passed(level: int, count: int = 5) -> int:
+        return sum(
+            sampling.filter(logging.LogRecord(
+                'test', level, 'module.py', 10, 'message', None, None))
+            for _ in range(count)
+        )
+
+    assert passed(logging.DEBUG) == 2
+    assert passed(logging.INFO) == 5
+    now[0] += 1
+    assert passed(logging.DEBUG) == 2
+    assert logger_module.SamplingFilter(rate=0).filter(logging.LogRecord(
+        'test', logging.DEBUG, 'module.py', 10, 'message', None, None))
+
+
+def test_log_listener_shutdown() -> None:
+    marker = f'listener {uuid4().hex}'
+    logger_module.start_log_listener()
+    logger_module.logger.warning(marker)
+    logger_module.stop_log_listener()
+    try:
+        assert logger_module.listener._thread is None
+        log_file = Path(logger_module.path, logger_module.LOG_FILE)
+        assert marker in log_file.read_text(encoding='utf-8')
+    finally:
+        logger_module.start_log_listener()
+    assert logger_module.listener._thread.is_alive()
+
+
+def test_s3_signature(monkeypatch) -> None:
+    class FrozenDatetime(datetime):
+        @classmethod
+        def utcnow(cls):
+            return datetime(2013, 5, 24)
+
+    monkeypatch.setattr(storage_module, 'datetime', FrozenDatetime)
+    s3 = S3Storage(
+        endpoint_url='http://127.0.0.1:9000',
+        bucket='files',
+        region='us-east-1',
+        access_key='AKIDEXAMPLE',
+        secret_key='wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY',
+        part_size=5 * 1024 * 1024,
+    )
+    # Подписи тех же запросов, посчитанные botocore.
+    for params, query, signature in (
+        (
+            None, '',
+            '4eb6192803b1f9c77fbc49964e578597'
+            '722e5c29c7a0ba59721cd539fa2a2901'
+        ),
+        (
+            {'partNumber': 2, 'uploadId': 'x y'},
+            '?partNumber=2&uploadId=x%20y',
+            'e9f425b9c6e48cb22cfa571b596b4a51'
+            'b09569a51da9fd8b8c67e4858dcf0030'
+        ),
+    ):
+        url, headers = s3._request(
+            'GET', 'a/b c.txt', params, {'Range': 'bytes=0-3'})
+        assert url == f'http://127.0.0.1:9000/files/a/b%20c.txt{query}'
+        assert headers['authorization'] == (
+            'AWS4-HMAC-SHA256 Credential=AKIDEXAMPLE/20130524/us-east-1/'
+            's3/aws4_request, SignedHeaders=host;range;'
+            f'x-amz-content-sha256;x-amz-date, Signature={signature}'
+        )
+
+
+async def test_s3_storage(tmp_path) -> None:
+    part_size = 5 * 1024 * 1024
+    s3 = S3Storage(
+        endpoint_url=app_settings.s3_endpoint_url,
+        bucket=f'test-{uuid4().hex}',
+        region=app_settings.s3_region,
+        access_key='test',
+        secret_key='test',
+        part_size=part_size,
+    )
+    await s3.start()
+    try:
+        small = tmp_path / 'small'
+        small.write_bytes(b'0123456789')
+        with pytest.raises(StorageError):
+            await s3.put('a/small', small)
+        await s3._send('PUT', '')
+        small.write_bytes(b'0123456789')
+        await s3.put('a/small', small)
+        assert not small.exists()
+        assert await s3.exists('a/small')
+        assert not await s3.exists('a/missing')
+        assert b''.join([c async for c in s3.read('a/small', 2, 5)]) == (
+            b'2345')
+        content = os.urandom(2 * part_size + 1000)
+        large = tmp_path / 'large'
+        large.write_bytes(content)
+        await s3.put('b/large', large)
+        assert b''.join([c async for c in s3.read('b/large')]) == content
+        tail = b''.join(
+            [c async for c in s3.read('b/large', part_size * 2)])
+        assert tail == content[part_size * 2:]
+        assert [key async for key in s3.keys('a/')] == ['a/small']
+        assert sorted([key async for key in s3.keys()]) == [
+            'a/small', 'b/large']
+        await s3.delete_prefix('b/')
+        assert not await s3.exists('b/large')
+        await s3.delete('a/small')
+        assert [key async for key in s3.keys()] == []
+    finally:
+        await s3.close()
+
+
+async def test_logout(
+    client: AsyncClient, async_session: AsyncSession
+) -> None:
+    response = await client.post(
+        '/logout',
+        headers={'Authorization': f'Bearer {test_user.token}'}
+    )
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    response = await client.get(
+        '/me',
+        headers={'Authorization': f'Bearer {test_user.token}'}
+    )
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert await token_crud.delete_expired(async_session, 100) >= 1